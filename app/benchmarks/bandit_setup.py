@@ -0,0 +1,62 @@
+"""Compare per-call cost of building a new bandit manager for each source,
+against reusing managers, whose configuration and test set are built once.
+
+Run from the app directory, with the app environment set: python -m benchmarks.bandit_setup
+"""
+
+import argparse
+from io import BytesIO
+import time
+from bandit.core import config, manager
+from qcl.integrations import security
+
+SOURCE = '''import subprocess
+
+
+def factorial(n: int) -> int:
+    if not isinstance(n, int):
+        raise TypeError("Input must be an integer.")
+    assert n >= 0
+    if n == 0:
+        return 1
+    exec("print('test')")  # nosec B102
+    subprocess.call(f"echo {n}", shell=True)
+    return n * factorial(n - 1)
+'''
+
+
+def run_bandit_per_call(source_code: str) -> list:
+    "Previous implementation: new configuration, manager and test set for every call."
+
+    bandit_manager = manager.BanditManager(config.BanditConfig(), "file")
+    bandit_manager._parse_file(
+        security.SNIPPET_NAME,
+        BytesIO(source_code.encode("utf-8")),
+        [security.SNIPPET_NAME],
+    )
+    return bandit_manager.get_issue_list()
+
+
+def measure(func, rounds: int) -> float:
+    "Return average milliseconds per call."
+
+    func(SOURCE)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(SOURCE)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=1000)
+    args = parser.parse_args()
+
+    # both must find the same issues
+    assert len(run_bandit_per_call(SOURCE)) == len(security.run_bandit(SOURCE))
+
+    before = measure(run_bandit_per_call, args.rounds)
+    after = measure(security.run_bandit, args.rounds)
+    print(f"per-call manager: {before:.3f} ms")
+    print(f"reused managers:  {after:.3f} ms")
+    print(f"speedup:          {before / after:.2f}x")
@@ -0,0 +1,69 @@
+"""Measure the local keyword classifier against keywords stored in the library:
+build time, time per suggestion, and how many suggested keywords match the stored ones.
+Every nth function is held out of the model and used for the evaluation.
+
+Run from the app directory, with the app environment set: python -m benchmarks.keyword_classifier
+"""
+
+import argparse
+import statistics
+import time
+from qcl import app
+from qcl.models import function
+from qcl.utils import keyword_classifier
+
+
+def load_library() -> list[tuple[str, str]]:
+    "(code, keywords) of all functions that have keywords."
+
+    rows = []
+    after = (0, 0)
+    while batch := function.list_keyword_corpus(after, keyword_classifier.BATCH_SIZE):
+        rows.extend(batch)
+        after = (batch[-1].modified, batch[-1].function_id)
+    return [
+        (row.code, row.keywords)
+        for row in rows
+        if keyword_classifier.parse_keywords(row.keywords)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--holdout", type=int, default=5, help="hold out every nth function"
+    )
+    args = parser.parse_args()
+
+    with app.app_context():
+        library = load_library()
+    train = [item for i, item in enumerate(library) if i % args.holdout]
+    test = [item for i, item in enumerate(library) if not i % args.holdout]
+    if not train or not test:
+        raise SystemExit("Not enough functions with keywords in the library")
+
+    start = time.perf_counter()
+    model = keyword_classifier.KeywordModel()
+    model.add(train)
+    built = time.perf_counter() - start
+
+    timings = []
+    suggested = 0
+    expected = 0
+    matched = 0
+    for code, keywords in test:
+        start = time.perf_counter()
+        suggestions = model.suggest(code)
+        timings.append(time.perf_counter() - start)
+        stored = set(keyword_classifier.parse_keywords(keywords))
+        suggested += len(suggestions)
+        expected += len(stored)
+        matched += len(stored.intersection(suggestions))
+
+    print(f"built from {len(train)} functions in {built * 1000:.1f} ms")
+    print(
+        f"suggest   median {statistics.median(timings) * 1000:.2f} ms"
+        f"  max {max(timings) * 1000:.2f} ms"
+    )
+    print(f"precision {matched / suggested if suggested else 0:.2f}")
+    print(f"recall    {matched / expected:.2f}")
@@ -0,0 +1,110 @@
+"""Measure throughput of the LLM steps of the add function wizard: /doc, /test and /classify,
+with the fake LLM backend instead of OpenAI. Each simulated user logs in with the given account,
+and walks through the wizard repeatedly, with new source code each time so the LLM cache doesn't answer.
+
+Run from the app directory, with the app environment set:
+python -m benchmarks.llm_wizard --username user@example.com --password secret
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import time
+from qcl import app
+from qcl.integrations import gpt, llm_backends, prefetch
+
+SOURCE = '''def scale_{index}(values: list[float], factor: float) -> list[float]:
+    return [value * factor for value in values]
+'''
+
+# steps of the wizard that wait for the LLM
+STEPS = ("doc", "test", "classify")
+
+
+def login(username: str, password: str):
+    client = app.test_client()
+    response = client.post("/login", data={"username": username, "password": password})
+    if response.status_code != 302:
+        raise RuntimeError("Login failed")
+    return client
+
+
+def run_wizard(client, index: int) -> dict[str, float]:
+    "Walk through the wizard once, return seconds spent on each LLM step."
+
+    code = SOURCE.format(index=index)
+    unittests = llm_backends.FAKE_UNITTESTS
+    requests = {
+        "doc": ("/doc", {"code": code, "generate": "1"}),
+        "test": ("/test", {"documented": code, "generate": "1"}),
+        "classify": ("/classify", {"generate": "1"}),
+    }
+
+    # the steps expect the previous ones to be done, the code is used as is
+    client.post("/add", data={"code": code, "doc": "1"})
+    client.post("/doc", data={"code": code, "documented": code, "next": "1"})
+    client.post(
+        "/test", data={"documented": code, "unittests": unittests, "next": "1"}
+    )
+
+    timings = {}
+    for step in STEPS:
+        path, data = requests[step]
+        start = time.perf_counter()
+        response = client.post(path, data=data)
+        timings[step] = time.perf_counter() - start
+        if response.status_code != 200 or b"error-message" in response.data:
+            raise RuntimeError(f"{path} failed")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True, help="a verified account")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--users", type=int, default=4, help="concurrent users")
+    parser.add_argument("--rounds", type=int, default=5, help="wizard runs per user")
+    parser.add_argument("--latency", type=float, default=llm_backends.FAKE_LLM_LATENCY)
+    parser.add_argument("--jitter", type=float, default=llm_backends.FAKE_LLM_JITTER)
+    parser.add_argument(
+        "--distribution",
+        choices=["fixed", "uniform", "normal", "lognormal"],
+        default=llm_backends.FAKE_LLM_DISTRIBUTION,
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    gpt.backend = llm_backends.FakeBackend(
+        args.latency, args.jitter, args.distribution, args.seed
+    )
+    # only measure the requests made by the steps themselves
+    prefetch.PREFETCH = False
+
+    clients = [login(args.username, args.password) for _ in range(args.users)]
+    timings = {step: [] for step in STEPS}
+    lock = threading.Lock()
+    # every run gets its own source code, also across benchmark runs
+    offset = time.time_ns()
+
+    def simulate_user(user: int) -> None:
+        for round_ in range(args.rounds):
+            result = run_wizard(clients[user], offset + user * args.rounds + round_)
+            with lock:
+                for name, seconds in result.items():
+                    timings[name].append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        for future in [executor.submit(simulate_user, i) for i in range(args.users)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        print(
+            f"{name:9} median {statistics.median(seconds) * 1000:7.1f} ms"
+            f"  max {max(seconds) * 1000:7.1f} ms"
+        )
+    wizards = args.users * args.rounds
+    print(f"{wizards} wizard runs in {elapsed:.1f} s, {wizards / elapsed:.2f} runs/sec")
@@ -3,5 +3,8 @@
 # Initialize the database
 python init_db.py
 
+# Start with an empty cache, it's shared by the workers and kept when one restarts
+python -c "from qcl import cache; cache.clear()"
+
 # Start the Gunicorn server
 exec gunicorn -c gunicorn_config.py qcl:app
\ No newline at end of file
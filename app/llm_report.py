@@ -0,0 +1,57 @@
+"""Summarize LLM usage per day: requests, outcomes, latency and tokens for each mode and model.
+Based on the llm_events table, which gets a row for every LLM request, including cache hits.
+Events are kept for LLM_EVENTS_RETENTION_DAYS, 90 by default.
+"""
+
+import argparse
+import logging
+from qcl.models import llm_events
+from qcl.utils import general
+
+COLUMNS = (
+    ("day", 10),
+    ("mode", 10),
+    ("model", 14),
+    ("requests", 8),
+    ("cached", 6),
+    ("rejected", 8),
+    ("invalid", 7),
+    ("errors", 6),
+    ("cancelled", 9),
+    ("truncated", 9),
+    ("p50_ms", 7),
+    ("p95_ms", 7),
+    ("prompt_tokens", 13),
+    ("completion_tokens", 17),
+)
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.0f}"
+    return str(value)
+
+
+def report(days: int) -> None:
+    rows = llm_events.summarize(general.get_time_hours_ago(days * 24), by_day=True)
+    print(" ".join(name.rjust(width) for name, width in COLUMNS))
+    for row in rows:
+        values = row._asdict()
+        print(
+            " ".join(
+                format_value(values[name]).rjust(width) for name, width in COLUMNS
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    # the app logs every query on debug level
+    logging.getLogger().setLevel(logging.INFO)
+
+    report(args.days)
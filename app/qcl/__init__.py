@@ -27,7 +27,6 @@ app.secret_key = os.environ["FLASK_SESSION_KEY"]
 app.config.from_object(Config)
 db = SQLAlchemy(app)
 cache = Cache(app)
-cache.clear()
 
 # set content security policy (CSP)
 csp = {
@@ -0,0 +1,136 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import os
+import time
+from qcl import app
+from qcl.integrations import linter, security, typecheck
+from qcl.models.result_cache import ResultCache
+
+# how long to wait for each tool, counted from the start of the checks
+DEADLINES = {
+    "lint": float(os.environ.get("LINT_DEADLINE", "20")),
+    "security": float(os.environ.get("SECURITY_DEADLINE", "20")),
+    "type": float(os.environ.get("TYPE_DEADLINE", "20")),
+}
+
+# results are reused for identical source code, as long as the tools stay the same
+analysis_cache = ResultCache(
+    "analysis",
+    max_entries=int(os.environ.get("ANALYSIS_CACHE_SIZE", "10000")),
+    max_age=int(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+
+TOOLS = {
+    "lint": linter.run_pylint,
+    "security": security.run_bandit,
+    "type": typecheck.run_pyright,
+}
+
+FINGERPRINTS = {
+    "lint": linter.fingerprint,
+    "security": security.fingerprint,
+    "type": typecheck.fingerprint,
+}
+
+
+def cache_key(tool: str, source_code: str) -> str:
+    "Hash of the source code and the tool version and configuration."
+
+    digest = hashlib.sha256()
+    digest.update(FINGERPRINTS[tool]().encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(source_code.encode("utf-8"))
+    return f"{tool}:{digest.hexdigest()}"
+
+
+def _get_cached(key: str) -> list[dict] | None:
+    "Fetch result from cache, a broken cache is treated as a miss."
+
+    try:
+        return analysis_cache.get(key)
+    except Exception:
+        app.logger.exception("Failed to read analysis cache")
+        return None
+
+
+def _set_cached(key: str, result: list[dict]) -> None:
+    "Save result to cache, failing to do so is not fatal."
+
+    try:
+        analysis_cache.set(key, result)
+    except Exception:
+        app.logger.exception("Failed to update analysis cache")
+
+
+def _no_report(tool: str, result: list[dict] | str) -> None:
+    "Used when the caller doesn't need results of each tool as they finish."
+
+
+def run_checks(
+    source_code: str, report=None
+) -> tuple[dict[str, list[dict]], list[str], list[str]]:
+    """Run all static checkers in parallel, each with its own deadline.
+    Returns results of the tools that finished in time, and names of the tools that timed out, and that failed.
+    If given, report(tool, result) is called as soon as each tool is done,
+    with "timed out" or "failed" as result when there are no results.
+    """
+
+    start = time.monotonic()
+    report = report or _no_report
+
+    # reuse earlier results for the same source code
+    keys = {tool: cache_key(tool, source_code) for tool in TOOLS}
+    results = {}
+    for tool, key in keys.items():
+        cached = _get_cached(key)
+        if cached is not None:
+            results[tool] = cached
+            report(tool, cached)
+    app.logger.debug(f"Analysis cache: {analysis_cache.stats()}")
+
+    executor = ThreadPoolExecutor(max_workers=len(TOOLS))
+    try:
+        pending = {
+            tool: executor.submit(func, source_code)
+            for tool, func in TOOLS.items()
+            if tool not in results
+        }
+
+        timed_out = []
+        failed = []
+        while pending:
+            # wake up when a tool finishes, or the nearest deadline passes
+            nearest = min(start + DEADLINES[tool] for tool in pending)
+            done, _ = wait(
+                pending.values(),
+                timeout=max(nearest - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for tool, future in list(pending.items()):
+                if future in done:
+                    del pending[tool]
+                    try:
+                        results[tool] = future.result()
+                    except TimeoutError:
+                        # the tool gave up
+                        timed_out.append(tool)
+                        report(tool, "timed out")
+                    except Exception:
+                        # results of the other tools are still shown, the failure is not cached
+                        app.logger.exception(f"{tool} check failed")
+                        failed.append(tool)
+                        report(tool, "failed")
+                    else:
+                        _set_cached(keys[tool], results[tool])
+                        report(tool, results[tool])
+                elif time.monotonic() >= start + DEADLINES[tool]:
+                    # we stop waiting for it
+                    del pending[tool]
+                    timed_out.append(tool)
+                    report(tool, "timed out")
+    finally:
+        # don't wait for the tools that are still running
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, timed_out, failed
@@ -1,27 +1,167 @@
-from io import StringIO
+from functools import cache
+from importlib.metadata import version
+from io import BytesIO, StringIO, TextIOWrapper
 import json
-from pylint.lint import Run
+import multiprocessing
+import os
+import sys
+import threading
+from pylint.config import find_default_config_files
+from pylint.lint import PyLinter, Run
 from pylint.reporters.json_reporter import JSONReporter
+from qcl.utils import processes
 
+# pool configuration
+PYLINT_POOL_SIZE = int(os.environ.get("PYLINT_POOL_SIZE", "2"))
+PYLINT_MAX_JOBS_PER_WORKER = int(os.environ.get("PYLINT_MAX_JOBS_PER_WORKER", "100"))
+PYLINT_TIMEOUT = float(os.environ.get("PYLINT_TIMEOUT", "30"))
 
-def run_pylint(filename):
-    "Run pylint against a given file"
+# name under which the submitted source code is linted
+SNIPPET_NAME = "snippet.py"
+
+# the pool is created lazily, separately in each web server worker
+_pool = None
+_pool_pid = None
+_pool_jobs = 0
+_pool_fingerprint = None
+_pool_lock = threading.Lock()
+
+# pre-initialized linter, living inside each pool worker
+_linter: PyLinter | None = None
+
+
+def _set_stdin(source_code: str) -> None:
+    "Feed source code to pylint, which reads it from stdin in --from-stdin mode."
+
+    sys.stdin = TextIOWrapper(BytesIO(source_code.encode("utf-8")), encoding="utf-8")
+
+
+def _init_worker() -> None:
+    """Initialize the pool worker: register checkers, parse options and bootstrap astroid once,
+    by linting a trivial snippet. The resulting linter is reused for all jobs of this worker.
+    """
+
+    global _linter
+
+    _set_stdin("x = 1\n")
+    run = Run(
+        ["--from-stdin", SNIPPET_NAME], reporter=JSONReporter(StringIO()), exit=False
+    )
+    _linter = run.linter
+
+
+def _lint_source(source_code: str) -> list[dict]:
+    "Lint the given source code using the pre-initialized linter, return the raw JSON output."
+
+    if _linter is None:
+        _init_worker()
 
     # redirect output to temporary stringio object
     pylint_output = StringIO()
 
-    # get results in json
-    reporter = JSONReporter(pylint_output)
+    # get results in json, using a fresh reporter so messages don't pile up between jobs
+    _linter.set_reporter(JSONReporter(pylint_output))
+
+    # reset message counters
+    _linter.open()
 
     # run pylint
-    Run([filename], reporter=reporter, exit=False)
+    _set_stdin(source_code)
+    _linter.check([SNIPPET_NAME])
+    _linter.generate_reports()
 
     # scroll back to start
     pylint_output.seek(0)
 
     # read the output
-    lint_result = json.load(pylint_output)
+    return json.load(pylint_output)
+
+
+def _get_pool(config_fingerprint: str):
+    """Return the pool of warm lint workers, create it if needed.
+    Workers are recycled by replacing the whole pool, after each worker has handled
+    PYLINT_MAX_JOBS_PER_WORKER jobs on average, or when the configuration has changed.
+    """
+
+    global _pool, _pool_pid, _pool_jobs, _pool_fingerprint
+
+    with _pool_lock:
+        # the pool can't be shared with forked processes
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = None
+        elif (
+            _pool_jobs >= PYLINT_POOL_SIZE * PYLINT_MAX_JOBS_PER_WORKER
+            or _pool_fingerprint != config_fingerprint
+        ):
+            # let running jobs finish, the old workers exit after that
+            _pool.close()
+            _pool = None
+
+        if _pool is None:
+            # fork, so that workers inherit already imported modules instead of importing the whole app again
+            # workers are forked only here, under the fork lock, not by the pool on its own
+            context = multiprocessing.get_context("fork")
+            with processes.fork_lock:
+                _pool = context.Pool(
+                    processes=PYLINT_POOL_SIZE, initializer=_init_worker
+                )
+            _pool_pid = os.getpid()
+            _pool_jobs = 0
+            _pool_fingerprint = config_fingerprint
+
+        _pool_jobs += 1
+        return _pool
+
+
+def _reset_pool() -> None:
+    "Kill all pool workers, a new pool is created on next use."
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.terminate()
+        _pool = None
+
+
+@cache
+def _versions() -> str:
+    return f"pylint {version('pylint')} astroid {version('astroid')}"
+
+
+def fingerprint() -> str:
+    """Identify installed pylint version and configuration, results can be reused while it stays the same.
+    The configuration file is read on each call, so that editing it takes effect without a restart.
+    """
+
+    config_file = next(find_default_config_files(), None)
+    config = config_file.read_text(encoding="utf-8") if config_file else ""
+    return f"{_versions()} {config}"
+
+
+def run_pylint(source_code: str) -> list[dict]:
+    "Run pylint against given source code, using a pool of warm lint workers"
+
+    job = _get_pool(fingerprint()).apply_async(_lint_source, (source_code,))
+    try:
+        lint_result = job.get(timeout=PYLINT_TIMEOUT)
+    except multiprocessing.TimeoutError as e:
+        # the worker may be stuck, so replace the whole pool
+        _reset_pool()
+        raise TimeoutError("Linting took too long") from e
+
+    return _add_links(lint_result)
+
+
+def run_pylint_local(source_code: str) -> list[dict]:
+    """Run pylint against given source code in the current process, without the pool.
+    Meant for processes that are pool workers themselves, the linter is initialized on first use.
+    """
+
+    return _add_links(_lint_source(source_code))
+
 
+def _add_links(lint_result: list[dict]) -> list[dict]:
     # add link to the entry
     base_url = "https://pylint.pycqa.org/en/latest/user_guide/messages"
     for entry in lint_result:
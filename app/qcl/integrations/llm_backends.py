@@ -0,0 +1,206 @@
+import ast
+import json
+import os
+import random
+import re
+import threading
+import time
+import openai
+
+# load API key
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# which service answers LLM requests: "openai", or "fake" for offline benchmarks
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+
+# simulated response time of the fake backend, in seconds
+FAKE_LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "1.0"))
+FAKE_LLM_JITTER = float(os.environ.get("FAKE_LLM_JITTER", "0.2"))
+# fixed, uniform, normal or lognormal
+FAKE_LLM_DISTRIBUTION = os.environ.get("FAKE_LLM_DISTRIBUTION", "normal")
+FAKE_LLM_SEED = os.environ.get("FAKE_LLM_SEED")
+
+# canned response of the fake backend for unit tests
+FAKE_UNITTESTS = '''import unittest
+
+
+class Test(unittest.TestCase):
+    def test_canned(self):
+        # placeholder test from the fake LLM backend
+        self.assertTrue(True)
+'''
+
+
+def openai_backend(
+    message_list: list[dict[str, str]], model: str, mode: str, **options
+):
+    "Send the request to OpenAI."
+
+    return openai.ChatCompletion.create(model=model, messages=message_list, **options)
+
+
+class FakeBackend:
+    """Answer LLM requests locally, with canned but valid responses after a simulated delay.
+    Responses only depend on the request, the delays are random, from the given distribution.
+    For the lognormal distribution, latency is the median and jitter the sigma of the underlying normal distribution,
+    otherwise jitter is the spread around latency in seconds.
+    """
+
+    def __init__(
+        self,
+        latency: float = FAKE_LLM_LATENCY,
+        jitter: float = FAKE_LLM_JITTER,
+        distribution: str = FAKE_LLM_DISTRIBUTION,
+        seed=FAKE_LLM_SEED,
+    ) -> None:
+        if distribution not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Invalid latency distribution '{distribution}'")
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.random = random.Random(seed)
+        # requests come from several threads
+        self.lock = threading.Lock()
+
+    def delay(self) -> float:
+        "Draw the response time of one request, in seconds."
+
+        with self.lock:
+            if self.distribution == "fixed":
+                delay = self.latency
+            elif self.distribution == "uniform":
+                delay = self.random.uniform(
+                    self.latency - self.jitter, self.latency + self.jitter
+                )
+            elif self.distribution == "normal":
+                delay = self.random.gauss(self.latency, self.jitter)
+            else:
+                delay = self.latency * self.random.lognormvariate(0, self.jitter)
+        return max(delay, 0)
+
+    def __call__(
+        self, message_list: list[dict[str, str]], model: str, mode: str, **options
+    ):
+        "Build a response in the format of the OpenAI API, streamed if requested."
+
+        delay = self.delay()
+        functions = options.get("functions")
+        if functions:
+            time.sleep(delay)
+            arguments = json.dumps(_fake_enhancements(message_list))
+            message = {
+                "role": "assistant",
+                "content": None,
+                "function_call": {
+                    "name": functions[0]["name"],
+                    "arguments": arguments,
+                },
+            }
+            return {
+                "choices": [{"message": message, "finish_reason": "stop"}],
+                "usage": _fake_usage(message_list, arguments),
+            }
+
+        content = _fake_content(message_list, mode)
+        if options.get("stream"):
+            return self._stream(content, delay)
+        time.sleep(delay)
+        message = {"role": "assistant", "content": content}
+        return {
+            "choices": [{"message": message, "finish_reason": "stop"}],
+            "usage": _fake_usage(message_list, content),
+        }
+
+    @staticmethod
+    def _stream(content: str, delay: float):
+        "Yield the content in chunks of a few words, spreading the delay over them."
+
+        pieces = re.findall(r"\S*\s*", content)[:-1] or [content]
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield {"choices": [{"delta": {"content": piece}, "finish_reason": None}]}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+
+def _fake_usage(message_list: list[dict[str, str]], completion: str) -> dict:
+    "Token counts estimated from the length of the text, about four characters per token."
+
+    prompt_tokens = sum(len(message["content"]) for message in message_list) // 4
+    completion_tokens = len(completion) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _source_code(message_list: list[dict[str, str]]) -> str:
+    "Find the source code the user sent, enclosed in triple backticks."
+
+    for message in message_list:
+        if message["role"] == "user" and message["content"].startswith("```"):
+            return message["content"].strip("`")
+    raise ValueError("No source code in request")
+
+
+def _fake_documented(source_code: str) -> str:
+    "Add a placeholder docstring to the function, keeping the code otherwise as is."
+
+    parsed = ast.parse(source_code)
+    function = next(node for node in parsed.body if isinstance(node, ast.FunctionDef))
+    if ast.get_docstring(function) is not None:
+        return source_code
+
+    first = function.body[0]
+    lines = source_code.splitlines()
+    indent = " " * first.col_offset
+    docstring = f'{indent}"Placeholder documentation of {function.name}."'
+    lines.insert(first.lineno - 1, docstring)
+    return "\n".join(lines)
+
+
+def _fake_keywords(source_code: str) -> list[str]:
+    "Words of the function name, which are stable for the same code."
+
+    parsed = ast.parse(source_code)
+    names = [node.name for node in parsed.body if isinstance(node, ast.FunctionDef)]
+    words = [word.lower() for name in names for word in name.split("_") if word]
+    return sorted(set(words)) or ["python"]
+
+
+def _fake_enhancements(message_list: list[dict[str, str]]) -> dict:
+    source_code = _source_code(message_list)
+    return {
+        "verdict": "clean",
+        "documented": _fake_documented(source_code),
+        "unittests": FAKE_UNITTESTS,
+        "keywords": _fake_keywords(source_code),
+    }
+
+
+def _fake_content(message_list: list[dict[str, str]], mode: str) -> str:
+    "Canned response for each mode of the gpt module."
+
+    if mode.startswith("check-"):
+        return "clean"
+    source_code = _source_code(message_list)
+    if mode == "doc":
+        return f"```python\n{_fake_documented(source_code)}\n```"
+    if mode == "test":
+        return f"```python\n{FAKE_UNITTESTS}```"
+    if mode == "classify":
+        return json.dumps(_fake_keywords(source_code))
+    raise NotImplementedError(f"Invalid mode '{mode}'")
+
+
+def get_backend(name: str = LLM_BACKEND):
+    """Return the backend by name. Backends are called with (message_list, model, mode, **options),
+    where options are passed on to the OpenAI API, and return responses in the format of the OpenAI API.
+    """
+
+    if name == "openai":
+        return openai_backend
+    elif name == "fake":
+        return FakeBackend()
+    else:
+        raise ValueError(f"Invalid LLM backend '{name}'")
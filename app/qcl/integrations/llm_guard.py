@@ -0,0 +1,231 @@
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import math
+import os
+import threading
+import time
+from qcl import app
+
+# seconds to wait for a response, before giving up on the model
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+
+# send a duplicate request, when the first one is slower than this percentile of recent requests
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "true").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+# recent requests are needed to know what is slow
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 200
+
+# after this many failures in a row, requests to the model fail right away for the cooldown, in seconds
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+
+# model to use when another one fails, as comma separated pairs like "gpt-4:gpt-3.5-turbo",
+# none by default, as every request goes to gpt-3.5-turbo and it has no smaller stand-in
+LLM_FALLBACK_MODELS = dict(
+    pair.split(":", 1)
+    for pair in os.environ.get("LLM_FALLBACK_MODELS", "").split(",")
+    if pair
+)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Track failures of a model. The circuit opens after too many failures in a row,
+    and after the cooldown a single trial request decides whether it closes again.
+    """
+
+    def __init__(self, failures: int, cooldown: float) -> None:
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failed = 0
+        self.opened = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened >= self.cooldown:
+                self.state = "half-open"
+                return True
+            # open, or trial request already in flight
+            return False
+
+    def success(self) -> None:
+        with self.lock:
+            self.state = "closed"
+            self.failed = 0
+
+    def failure(self) -> bool:
+        "Record a failure, return True if it opened the circuit."
+
+        with self.lock:
+            self.failed += 1
+            if self.state == "half-open" or (
+                self.state == "closed" and self.failed >= self.failures
+            ):
+                self.state = "open"
+                self.opened = time.monotonic()
+                return True
+            return False
+
+
+# state is kept separately in each web server worker
+_breakers = {}
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_metrics = Counter()
+_lock = threading.Lock()
+
+_executor = None
+_executor_pid = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+
+    with _lock:
+        # threads don't survive forking
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    with _lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(
+                LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN
+            )
+        return _breakers[model]
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _metrics[name] += 1
+
+
+def _hedge_delay(model: str) -> float | None:
+    "Seconds after which a request to the model is unusually slow, None if not known yet."
+
+    with _lock:
+        samples = sorted(_latencies[model])
+    if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    index = math.ceil(len(samples) * LLM_HEDGE_PERCENTILE / 100) - 1
+    return samples[max(index, 0)]
+
+
+def _timed(backend, message_list, model, mode, **options):
+    start = time.monotonic()
+    response = backend(message_list, model, mode, **options)
+    with _lock:
+        _latencies[model].append(time.monotonic() - start)
+    return response
+
+
+def _call_with_deadline(backend, message_list, model, mode, timeout, **options):
+    "Call the backend, hedging with a duplicate request if the first one is slow."
+
+    deadline = time.monotonic() + timeout
+    options["request_timeout"] = timeout
+    executor = _get_executor()
+    first = executor.submit(_timed, backend, message_list, model, mode, **options)
+    pending = {first}
+    hedge_at = None
+    if LLM_HEDGE and (delay := _hedge_delay(model)) is not None:
+        hedge_at = time.monotonic() + delay
+
+    error = None
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            _count("timeouts")
+            raise TimeoutError(f"No response from {model} in {timeout} s")
+        wake = deadline if hedge_at is None else min(deadline, hedge_at)
+        done, pending = wait(pending, timeout=wake - now, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                # the other request may still succeed
+                error = e
+                continue
+            if future is not first:
+                _count("hedge_wins")
+            return response
+
+        if hedge_at is not None and time.monotonic() >= hedge_at and pending:
+            hedge_at = None
+            _count("hedges")
+            remaining = deadline - time.monotonic()
+            options["request_timeout"] = remaining
+            pending.add(
+                executor.submit(_timed, backend, message_list, model, mode, **options)
+            )
+
+    raise error
+
+
+def call(backend, message_list, model: str, mode: str, timeout=None, **options):
+    """Send the request with a deadline, falling back to other models if the model fails or its circuit is open.
+    Streamed requests are not hedged, and the deadline only covers starting the response.
+    Returns the response and the model that gave it.
+    """
+
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    error = None
+    tried = set()
+    while model is not None and model not in tried:
+        tried.add(model)
+        breaker = _breaker(model)
+        if not breaker.allow():
+            _count("breaker_rejections")
+            error = CircuitOpenError(f"Circuit open for {model}")
+        else:
+            _count("requests")
+            try:
+                if options.get("stream"):
+                    response = backend(
+                        message_list, model, mode, request_timeout=timeout, **options
+                    )
+                else:
+                    response = _call_with_deadline(
+                        backend, message_list, model, mode, timeout, **options
+                    )
+                breaker.success()
+                return response, model
+            except Exception as e:
+                _count("failures")
+                app.logger.warning(f"Request to {model} failed: {e!r}")
+                if breaker.failure():
+                    _count("breaker_opened")
+                    app.logger.error(f"Circuit opened for {model}")
+                error = e
+
+        model = LLM_FALLBACK_MODELS.get(model)
+        if model is not None and model not in tried:
+            _count("fallbacks")
+
+    raise error
+
+
+def stats() -> dict:
+    "Counters, circuit states and hedging thresholds, in this web server worker."
+
+    with _lock:
+        metrics = dict(_metrics)
+        models = set(_latencies) | set(_breakers)
+    out = {"metrics": metrics, "models": {}}
+    for model in sorted(models):
+        out["models"][model] = {
+            "circuit": _breaker(model).state,
+            "hedge_delay": _hedge_delay(model),
+        }
+    return out
@@ -0,0 +1,111 @@
+import math
+import os
+import sys
+import sysconfig
+import threading
+
+# the sandbox is shared with the AWS Lambda function, the Docker image has it next to the app
+try:
+    import lambda_function
+except ImportError:
+    # running from a checkout of the repository
+    sys.path.append(
+        os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "..", "..", "..", "aws", "lambda")
+        )
+    )
+    import lambda_function
+
+# run at most this many sandboxes at once in each web server worker, and keep as many started in advance
+LOCAL_SANDBOX_WORKERS = int(os.environ.get("LOCAL_SANDBOX_WORKERS", "4"))
+
+# seconds the tests may run, before the sandbox is killed
+LOCAL_SANDBOX_TIMEOUT = float(os.environ.get("LOCAL_SANDBOX_TIMEOUT", "10"))
+
+# address space of a sandbox in megabytes
+LOCAL_SANDBOX_MEMORY = int(os.environ.get("LOCAL_SANDBOX_MEMORY", "512"))
+
+# the tests run inside the web server container, so they get no more than they need
+LIMITS = {
+    **lambda_function.SANDBOX_LIMITS,
+    "RLIMIT_AS": LOCAL_SANDBOX_MEMORY * 2**20,
+    "RLIMIT_CPU": math.ceil(LOCAL_SANDBOX_TIMEOUT),
+}
+
+# like in the Lambda runtime, the tests may read the standard library and installed packages
+READ_PATHS = tuple(
+    sorted(
+        {
+            os.path.join(sysconfig.get_path(name), "")
+            for name in ("stdlib", "platstdlib", "purelib", "platlib")
+        }
+    )
+)
+
+# sandboxes are kept separately in each web server worker
+_slots = threading.BoundedSemaphore(LOCAL_SANDBOX_WORKERS)
+_warm = []
+_warm_pid = None
+_lock = threading.Lock()
+
+
+def _take_sandbox() -> tuple:
+    "A sandbox started in advance, or a new one if none are waiting."
+
+    global _warm, _warm_pid
+
+    with _lock:
+        # processes don't belong to a forked child
+        if _warm_pid != os.getpid():
+            _warm = []
+            _warm_pid = os.getpid()
+        while _warm:
+            sandbox = _warm.pop()
+            if sandbox[0].is_alive():
+                return sandbox
+            sandbox[0].join()
+    return lambda_function.start_sandbox()
+
+
+def _prepare_sandbox() -> None:
+    "Start a sandbox for a later test run, unless enough are waiting already."
+
+    with _lock:
+        if _warm_pid == os.getpid() and len(_warm) < LOCAL_SANDBOX_WORKERS:
+            _warm.append(lambda_function.start_sandbox())
+
+
+def execute(func: str, test: str) -> dict:
+    """Run the unit tests against the given function, in a single-use sandbox process on this server.
+    Returns the results in the format of the Lambda function."""
+
+    with _slots:
+        process, job_conn, result_conn = _take_sandbox()
+        job = (test, func, READ_PATHS, LIMITS)
+        try:
+            try:
+                lambda_function.send_json(job_conn, job)
+            except OSError:
+                # the waiting sandbox is gone, start over with a new one
+                result_conn.close()
+                process.join()
+                process, job_conn, result_conn = lambda_function.start_sandbox()
+                lambda_function.send_json(job_conn, job)
+            job_conn.close()
+            if result_conn.poll(LOCAL_SANDBOX_TIMEOUT):
+                # never unpickled, the tests control what comes out of the sandbox
+                results = lambda_function.receive_results(result_conn)
+            else:
+                process.kill()
+                results = {
+                    "error": "Unhandled",
+                    "payload": {
+                        "errorMessage": f"Task timed out after {LOCAL_SANDBOX_TIMEOUT:.2f} seconds"
+                    },
+                }
+        finally:
+            result_conn.close()
+            process.join()
+
+    _prepare_sandbox()
+    return results
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from uuid import UUID
+from qcl import app, cache
+from qcl.integrations import gpt
+from qcl.utils import general, jobs
+
+# start generating documentation, tests and keywords as soon as the source code is valid
+PREFETCH = os.environ.get("GPT_PREFETCH", "true").lower() == "true"
+
+
+def _key(session_id: UUID) -> str:
+    return f"prefetch:{session_id}"
+
+
+def _is_current(session_id: UUID, digest: str) -> bool:
+    "Check that the source code has not changed since the prefetch was started."
+
+    current = cache.get(_key(session_id))
+    return current is not None and current["digest"] == digest
+
+
+def _pipeline(session_id: UUID, source_code: str, digest: str, report) -> None:
+    "Generate documentation, then tests and keywords for it, stop early if the source code changes."
+
+    if gpt.ONE_SHOT:
+        enhancements = gpt.enhance_all(source_code)
+        report("documented", enhancements["documented"])
+        report("unittests", enhancements["unittests"])
+        report("keywords", ", ".join(enhancements["keywords"]))
+        return
+
+    documented = gpt.enhance_code(source_code, mode="doc")
+    report("documented", documented)
+    if not _is_current(session_id, digest):
+        app.logger.debug("Prefetch cancelled")
+        return
+
+    # both only need the documented code
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        unittests = executor.submit(gpt.enhance_code, documented, "test")
+        keywords = executor.submit(gpt.classify_code, documented)
+        report("unittests", unittests.result())
+        report("keywords", ", ".join(keywords.result()))
+
+
+def start(session_id: UUID, user_id: UUID, source_code: str) -> None:
+    """Start generating results for the later steps in the background, unless already started for this code.
+    Results for earlier source code of the session are discarded.
+    """
+
+    if not PREFETCH:
+        return
+
+    digest = general.digest(source_code)
+    if _is_current(session_id, digest):
+        return
+
+    job_id = jobs.submit(
+        user_id, _pipeline, session_id, source_code, digest, speculative=True
+    )
+    cache.set(
+        _key(session_id), {"digest": digest, "job_id": job_id}, timeout=jobs.JOB_TTL
+    )
+
+
+def get(session_id: UUID, user_id: UUID, source_code: str) -> dict[str, str]:
+    "Return the results that are ready for the given source code, by name: documented, unittests and keywords."
+
+    current = cache.get(_key(session_id))
+    if current is None or current["digest"] != general.digest(source_code):
+        return {}
+    job = jobs.get(current["job_id"], user_id)
+    if job is None:
+        return {}
+    return job["progress"]
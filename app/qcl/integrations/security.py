@@ -1,21 +1,56 @@
-from bandit.core import config, manager
+from functools import cache
+from importlib.metadata import version
+from io import BytesIO
+import threading
+from bandit.core import config, manager, meta_ast, metrics
 from bandit.core.docs_utils import get_url
 
+# name under which the submitted source code is checked
+SNIPPET_NAME = "./snippet.py"
 
-def run_bandit(filename):
-    "Run bandit security-check against a given file"
+# managers are reused, so that the configuration and test set are built once, not for every check
+_idle_managers = []
+_managers_lock = threading.Lock()
 
-    # initialize bandit
-    bandit_manager = manager.BanditManager(config.BanditConfig(), "file")
 
-    # fetch files to be tested
-    bandit_manager.discover_files([filename])
+@cache
+def fingerprint() -> str:
+    "Identify installed bandit version and configuration, results can be reused while it stays the same."
 
-    # run the tests
-    bandit_manager.run_tests()
+    return f"bandit {version('bandit')}"
 
-    # fetch results
-    results = bandit_manager.get_issue_list()
+
+def _take_manager() -> manager.BanditManager:
+    "An idle bandit manager with no results, or a new one if all are in use."
+
+    with _managers_lock:
+        if not _idle_managers:
+            return manager.BanditManager(config.BanditConfig(), "file")
+        bandit_manager = _idle_managers.pop()
+
+    # forget the previously checked source code
+    bandit_manager.results = []
+    bandit_manager.skipped = []
+    bandit_manager.scores = []
+    bandit_manager.metrics = metrics.Metrics()
+    bandit_manager.b_ma = meta_ast.BanditMetaAst()
+    return bandit_manager
+
+
+def run_bandit(source_code: str):
+    "Run bandit security-check against given source code"
+
+    bandit_manager = _take_manager()
+    try:
+        # run the tests, reading the source code from an in-memory buffer
+        fdata = BytesIO(source_code.encode("utf-8"))
+        bandit_manager._parse_file(SNIPPET_NAME, fdata, [SNIPPET_NAME])
+
+        # fetch results
+        results = bandit_manager.get_issue_list()
+    finally:
+        with _managers_lock:
+            _idle_managers.append(bandit_manager)
 
     # format output
     output = []
@@ -1,6 +1,11 @@
 import json
 import os
+import time
 import boto3
+from botocore.config import Config
+from qcl import app
+from qcl.models.result_cache import ResultCache
+from qcl.utils import ast_checks, general, jobs
 
 
 # Load keys
@@ -8,6 +13,9 @@ lambda_pytest_key_id = os.environ.get("PYTEST_KEY_ID")
 lambda_pytest_key_secret = os.environ.get("PYTEST_KEY_SECRET")
 lambda_pytest_region = os.environ.get("PYTEST_REGION")
 
+# seconds to wait for the tests to finish, longer than the timeout of the lambda function
+lambda_pytest_read_timeout = float(os.environ.get("PYTEST_READ_TIMEOUT", "65"))
+
 # Initialize a session
 session = boto3.Session(
     aws_access_key_id=lambda_pytest_key_id,
@@ -16,10 +24,35 @@ session = boto3.Session(
 )
 
 # Initialize Lambda client using the session
-lambda_client = session.client("lambda")
+lambda_client = session.client(
+    "lambda",
+    config=Config(
+        # tests are run by background jobs, each one can keep a connection open for reuse
+        max_pool_connections=max(jobs.JOB_WORKERS, 10),
+        # keep idle connections from being dropped between test runs
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=lambda_pytest_read_timeout,
+        # retry throttling and transient errors
+        retries={"mode": "standard", "max_attempts": 3},
+    ),
+)
 
+# where the unit tests run: "lambda" on AWS, or "local" in sandbox processes on this server
+TEST_BACKEND = os.environ.get("TEST_BACKEND", "lambda")
 
-def execute(func: str, test: str) -> dict:
+# change when the sandbox changes, so that results of the old one are not reused
+RUNNER_VERSION = "2"
+
+# results are reused for identical function and tests, when the tests give the same results every time
+test_cache = ResultCache(
+    "tests",
+    max_entries=int(os.environ.get("TEST_CACHE_SIZE", "10000")),
+    max_age=int(os.environ.get("TEST_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+
+def lambda_backend(func: str, test: str) -> dict:
     "Run the unit tests against the given function, using AWS lambda"
 
     data = json.dumps({"func": func, "test": test})
@@ -38,6 +71,90 @@ def execute(func: str, test: str) -> dict:
     return out
 
 
+def get_backend(name: str = TEST_BACKEND):
+    """Return the backend by name. Backends are called with (func, test),
+    and return results in the format of the Lambda function.
+    """
+
+    if name == "lambda":
+        return lambda_backend
+    elif name == "local":
+        # imported only when used, it starts sandbox processes
+        from qcl.integrations import local_sandbox
+
+        return local_sandbox.execute
+    else:
+        raise ValueError(f"Invalid test backend '{name}'")
+
+
+backend = get_backend()
+
+
+def cache_key(func: str, test: str) -> str:
+    "Hash of the function, the tests and the runner."
+
+    return f"{TEST_BACKEND}:{general.digest(RUNNER_VERSION, TEST_BACKEND, func, test)}"
+
+
+def get_cached(func: str, test: str) -> dict | None:
+    "Results of an earlier run of the same tests, a broken cache is treated as a miss."
+
+    try:
+        return test_cache.get(cache_key(func, test))
+    except Exception:
+        app.logger.exception("Failed to read test cache")
+        return None
+
+
+def _set_cached(func: str, test: str, results: dict) -> None:
+    "Save results of a completed run, if the next run would give the same results."
+
+    if "error" in results:
+        return
+    try:
+        if ast_checks.is_deterministic(func) and ast_checks.is_deterministic(test):
+            test_cache.set(cache_key(func, test), results)
+    except Exception:
+        app.logger.exception("Failed to update test cache")
+
+
+def execute(func: str, test: str) -> dict:
+    "Run the unit tests against the given function, using the configured backend"
+
+    cached = get_cached(func, test)
+    app.logger.debug(f"Test cache: {test_cache.stats()}")
+    if cached is not None:
+        return cached
+
+    start = time.monotonic()
+    out = backend(func=func, test=test)
+    if "error" in out and "payload" not in out:
+        # the sandbox failed to run the code, report it like the errors of the Lambda function
+        out = {"error": "Unhandled", "payload": {"errorMessage": out["error"]}}
+    _log_profile(out, time.monotonic() - start)
+    _set_cached(func, test, out)
+    return out
+
+
+def _log_profile(results: dict, elapsed: float) -> None:
+    "Log how much time and memory a test run used, for capacity planning."
+
+    if "error" in results:
+        app.logger.info(f"Test run failed after {elapsed:.3f} s")
+        return
+    # the Lambda function may be older than the profiling
+    tests = results.get("tests", [])
+    wall_time = sum(item["wall_time"] for item in tests)
+    cpu_time = sum(item["cpu_time"] for item in tests)
+    slowest = max(tests, key=lambda item: item["wall_time"], default=None)
+    max_rss = results.get("max_rss", 0) / 2**20
+    app.logger.info(
+        f"Test run of {results['total']} tests: {elapsed:.3f} s in total, "
+        f"{wall_time:.3f} s in tests, {cpu_time:.3f} s CPU, "
+        f"slowest {slowest['name'] if slowest else None}, peak memory {max_rss:.1f} MiB"
+    )
+
+
 def handle(result: dict) -> tuple:
     "Handle results from the lambda function."
 
@@ -74,4 +191,50 @@ def handle(result: dict) -> tuple:
             "errors": errors,
             "failures": failures,
             "skipped": skipped,
+            "tests": result.get("tests", []),
+            "max_rss": result.get("max_rss"),
         }
+
+
+def summarize(results: dict) -> dict:
+    """Summarize results of completed tests for the UI.
+    Returns the failures, and counts of passed and failed tests.
+    """
+
+    errors = results["errors"]
+    skipped = results["skipped"]
+    # counted before errors are listed with the failures, so that each test counts once
+    fail_count = len(results["failures"]) + len(errors) + len(skipped)
+    failures = results["failures"] + errors
+
+    if not failures and not results["successful"]:
+        failures = ["Failed to run unit tests"]
+        fail_count += 1
+
+    ok_count = results["total"] - fail_count
+    return {
+        "failures": failures,
+        "ok_count": ok_count,
+        "fail_count": fail_count,
+        "tests": results.get("tests", []),
+    }
+
+
+def run_tests(func: str, test: str, report=None) -> dict:
+    """Run the unit tests and summarize them for the UI.
+    Takes report like other background jobs, but has no partial results to publish.
+    """
+
+    try:
+        return summarize(execute(func=func, test=test))
+    except Exception:
+        error = "Failed to run unit tests"
+        app.logger.exception(error)
+        return {"failures": [error], "ok_count": 0, "fail_count": 1}
+
+
+def cached_summary(func: str, test: str) -> dict | None:
+    "Summary of an earlier run of the same tests, if it's cached."
+
+    results = get_cached(func, test)
+    return None if results is None else summarize(results)
@@ -1,26 +1,291 @@
+from functools import cache
+from importlib.metadata import version
+import itertools
 import json
+import os
+import queue
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from qcl.utils import fileops, processes
 
+PYRIGHT_LANGSERVER = os.environ.get("PYRIGHT_LANGSERVER", "pyright-langserver")
+PYRIGHT_TIMEOUT = float(os.environ.get("PYRIGHT_TIMEOUT", "30"))
 
-def run_pyright(filename) -> list[dict[str, str]]:
-    "Run pyright type-checking against a given file"
+# LSP diagnostic severities, hints are not reported by the pyright CLI either
+SEVERITIES = {1: "error", 2: "warning", 3: "information"}
+
+
+def _format_diagnostic(diag: dict, severity: str) -> dict[str, str]:
+    "Convert pyright diagnostic to the format shown on the UI."
+
+    issue = {}
+    issue["severity"] = severity
+    issue["message"] = diag["message"]
+    issue["line"] = diag["range"]["start"]["line"] + 1
+    issue["endLine"] = diag["range"]["end"]["line"] + 1
+    issue["col"] = diag["range"]["start"]["character"]
+    issue["endCol"] = diag["range"]["end"]["character"]
+    return issue
+
+
+class LanguageServer:
+    """Long-lived pyright language server, talking LSP over stdio.
+    Documents are type-checked in memory, the server is restarted if it crashes or hangs.
+    """
+
+    def __init__(self, command: list[str]) -> None:
+        self.command = command
+        self.process = None
+        self.messages = queue.Queue()
+        self.request_ids = itertools.count(1)
+        self.document_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        "Start the server process and complete the LSP handshake."
+
+        # own process group, so that node child processes can be killed along with the wrapper
+        with processes.fork_lock:
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        self.messages = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_messages,
+            args=(self.process.stdout, self.messages),
+            daemon=True,
+        )
+        reader.start()
+
+        deadline = time.monotonic() + PYRIGHT_TIMEOUT
+        request_id = self._request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "rootUri": None,
+                "capabilities": {
+                    "textDocument": {"publishDiagnostics": {"versionSupport": True}}
+                },
+            },
+        )
+        self._wait_for(lambda msg: msg.get("id") == request_id, deadline)
+        self._notify("initialized", {})
+
+    def stop(self) -> None:
+        "Kill the server process."
+
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+            self.process = None
+
+    def check(self, source_code: str) -> list[dict[str, str]]:
+        "Type-check given source code as an in-memory document, return the diagnostics."
+
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    return self._check(source_code)
+                except TimeoutError:
+                    # server hangs, replace it on next use
+                    self.stop()
+                    raise
+                except (EOFError, BrokenPipeError):
+                    # server crashed, restart it and try once more
+                    self.stop()
+                    if attempt:
+                        raise
+
+    def _check(self, source_code: str) -> list[dict[str, str]]:
+        if not self.is_running():
+            self.start()
+
+        # each check gets its own document, so stale diagnostics can't be mixed in
+        uri = f"untitled:snippet_{next(self.document_ids)}.py"
+        deadline = time.monotonic() + PYRIGHT_TIMEOUT
+        self._notify(
+            "textDocument/didOpen",
+            {
+                "textDocument": {
+                    "uri": uri,
+                    "languageId": "python",
+                    "version": 1,
+                    "text": source_code,
+                }
+            },
+        )
+        try:
+            message = self._wait_for(
+                lambda msg: msg.get("method") == "textDocument/publishDiagnostics"
+                and msg["params"]["uri"] == uri,
+                deadline,
+            )
+        finally:
+            if self.is_running():
+                self._notify("textDocument/didClose", {"textDocument": {"uri": uri}})
+
+        out = []
+        for diag in message["params"]["diagnostics"]:
+            severity = SEVERITIES.get(diag.get("severity", 1))
+            if severity is not None:
+                out.append(_format_diagnostic(diag, severity))
+        return out
+
+    def _send(self, message: dict) -> None:
+        body = json.dumps(message).encode("utf-8")
+        header = f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+        self.process.stdin.write(header + body)
+        self.process.stdin.flush()
+
+    def _request(self, method: str, params: dict) -> int:
+        request_id = next(self.request_ids)
+        self._send(
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        )
+        return request_id
+
+    def _notify(self, method: str, params: dict) -> None:
+        self._send({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def _wait_for(self, condition, deadline: float) -> dict:
+        "Process incoming messages until one matches the condition."
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Type checking took too long")
+            try:
+                message = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if message is None:
+                raise EOFError("Language server exited")
+
+            # answer requests coming from the server, no client features are supported
+            if "id" in message and "method" in message:
+                self._send({"jsonrpc": "2.0", "id": message["id"], "result": None})
+            elif condition(message):
+                return message
+
+    @staticmethod
+    def _read_messages(stream, messages: queue.Queue) -> None:
+        "Read LSP messages from the server and put them to the queue, None marks end of stream."
+
+        try:
+            while True:
+                content_length = None
+                while line := stream.readline():
+                    line = line.strip()
+                    if not line:
+                        break
+                    name, _, value = line.decode("ascii").partition(":")
+                    if name.lower() == "content-length":
+                        content_length = int(value)
+                if content_length is None:
+                    break
+                messages.put(json.loads(stream.read(content_length)))
+        finally:
+            messages.put(None)
+
+
+# the server is started lazily, separately in each web server worker
+_server = None
+_server_pid = None
+_server_lock = threading.Lock()
+
+
+def _get_server() -> LanguageServer:
+    global _server, _server_pid
+
+    with _server_lock:
+        # the server can't be shared with forked processes
+        if _server is None or _server_pid != os.getpid():
+            _server = LanguageServer([PYRIGHT_LANGSERVER, "--stdio"])
+            _server_pid = os.getpid()
+        return _server
+
+
+@cache
+def fingerprint() -> str:
+    "Identify installed pyright version and configuration, results can be reused while it stays the same."
+
+    return f"pyright {version('pyright')} {PYRIGHT_LANGSERVER}"
+
+
+def run_pyright(source_code: str) -> list[dict[str, str]]:
+    "Run pyright type-checking against given source code, using a persistent language server"
+
+    try:
+        return _get_server().check(source_code)
+    except FileNotFoundError:
+        # language server is not available, fall back to the CLI, with the file kept in memory
+        filename = fileops.create_tempfile(source_code, dir=fileops.MEMORY_DIR)
+        try:
+            return run_pyright_cli(filename)
+        finally:
+            fileops.delete_file(filename)
+
+
+def run_pyright_cli(filename) -> list[dict[str, str]]:
+    "Run pyright CLI type-checking against a given file"
 
     command = ["pyright", "--warnings", "--outputjson", filename]
-    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    with processes.fork_lock:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+    stdout, _ = process.communicate()
 
-    if result.returncode == 0:
+    if process.returncode == 0:
         return []
     else:
-        output_json = json.loads(result.stdout)
+        output_json = json.loads(stdout)
         diags = output_json["generalDiagnostics"]
         out = []
         for diag in diags:
-            issue = {}
-            issue["severity"] = diag["severity"]
-            issue["message"] = diag["message"]
-            issue["line"] = diag["range"]["start"]["line"] + 1
-            issue["endLine"] = diag["range"]["end"]["line"] + 1
-            issue["col"] = diag["range"]["start"]["character"]
-            issue["endCol"] = diag["range"]["end"]["character"]
-            out.append(issue)
+            out.append(_format_diagnostic(diag, diag["severity"]))
     return out
+
+
+def run_pyright_batch(sources: list[str]) -> list[list[dict[str, str]]]:
+    """Type-check many sources with a single pyright CLI run, each as its own file.
+    Returns the diagnostics of each source, in the same order.
+    """
+
+    with tempfile.TemporaryDirectory(dir=fileops.MEMORY_DIR) as directory:
+        # pyright reports resolved paths
+        directory = os.path.realpath(directory)
+        filenames = []
+        for i, source_code in enumerate(sources):
+            filename = os.path.join(directory, f"snippet_{i}.py")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write(source_code)
+            filenames.append(filename)
+
+        command = ["pyright", "--warnings", "--outputjson", *filenames]
+        with processes.fork_lock:
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+        stdout, _ = process.communicate()
+
+    # diagnostics refer to the files by absolute path
+    out = {filename: [] for filename in filenames}
+    if process.returncode != 0:
+        output_json = json.loads(stdout)
+        for diag in output_json["generalDiagnostics"]:
+            out[diag["file"]].append(_format_diagnostic(diag, diag["severity"]))
+    return [out[filename] for filename in filenames]
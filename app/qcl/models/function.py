@@ -1,16 +1,47 @@
 from typing import Any
 from uuid import UUID
 from sqlalchemy.engine import Row
-from qcl.utils import dbrunner
+from qcl.utils import dbrunner, serialize
+
+
+def _quality_counts(quality: dict[str, Any]) -> dict[str, int | None]:
+    "Issue counts of each tool and test outcome, None when not known."
+
+    counts = {
+        "lint_count": None,
+        "security_count": None,
+        "type_count": None,
+        "tests_passed": None,
+        "tests_failed": None,
+    }
+    if checks := quality.get("checks"):
+        for tool, result in checks["results"].items():
+            if tool not in checks["timed_out"]:
+                counts[f"{tool}_count"] = len(result)
+    if tests := quality.get("tests"):
+        counts["tests_passed"] = tests["ok_count"]
+        counts["tests_failed"] = tests["fail_count"]
+    return counts
 
 
 def save_function(
-    code: str, tests: str, keywords: str, usecase: str, name: str, user_id: UUID
+    code: str,
+    tests: str,
+    keywords: str,
+    usecase: str,
+    name: str,
+    user_id: UUID,
+    quality: dict[str, Any] | None = None,
 ) -> tuple[bool, str]:
+    """Save function to the library.
+    Quality holds results of the static checks and the test run, under keys "checks" and "tests" if they are known.
+    """
+
     query = """
-        INSERT INTO functions (code, tests, keywords, usecase, name, user_id)
-        VALUES (:code, :tests, :keywords, :usecase, :name, :user_id) RETURNING function_id
+        INSERT INTO functions (code, tests, keywords, usecase, name, user_id, quality, lint_count, security_count, type_count, tests_passed, tests_failed)
+        VALUES (:code, :tests, :keywords, :usecase, :name, :user_id, :quality, :lint_count, :security_count, :type_count, :tests_passed, :tests_failed) RETURNING function_id
         """
+    quality = quality or {}
     params = {
         "code": code,
         "tests": tests,
@@ -18,6 +49,8 @@ def save_function(
         "usecase": usecase,
         "name": name,
         "user_id": user_id,
+        "quality": serialize.compress(quality),
+        **_quality_counts(quality),
     }
     try:
         result = dbrunner.execute(query, params)
@@ -28,7 +61,7 @@ def save_function(
 
 
 def get_function(function_id: int) -> dict[str, Any]:
-    query = """SELECT f.user_id as user_id, f.name as name, f.code as code, f.tests as tests, f.usecase as usecase, f.keywords as keywords, u.username as username
+    query = """SELECT f.user_id as user_id, f.name as name, f.code as code, f.tests as tests, f.usecase as usecase, f.keywords as keywords, u.username as username, f.quality as quality
         FROM functions AS f
         JOIN users AS u ON f.user_id = u.user_id
         WHERE f.function_id = :function_id
@@ -41,12 +74,17 @@ def get_function(function_id: int) -> dict[str, Any]:
     row = result.first()
     if row is None:
         raise ValueError("Function not found")
-    return row._asdict()
+    fdata = row._asdict()
+
+    # functions saved before quality was stored have none
+    fdata["quality"] = serialize.decompress(fdata["quality"]) if fdata["quality"] else {}
+    return fdata
 
 
 def list_functions() -> list[Row]:
     query = """
-        SELECT f.function_id, f.name as name, f.usecase as usecase, f.keywords as keywords, u.username as username, r.average as average
+        SELECT f.function_id, f.name as name, f.usecase as usecase, f.keywords as keywords, u.username as username, r.average as average,
+        f.lint_count as lint_count, f.security_count as security_count, f.type_count as type_count, f.tests_passed as tests_passed, f.tests_failed as tests_failed
         FROM functions AS f
         JOIN users AS u ON f.user_id = u.user_id
         LEFT JOIN (
@@ -62,6 +100,24 @@ def list_functions() -> list[Row]:
     return result.all()
 
 
+def list_keyword_corpus(after: tuple[int, int], limit: int) -> list[Row]:
+    "List code and keywords of functions saved or edited after the given (modified, function_id), in that order."
+
+    query = """
+        SELECT function_id, code, keywords, modified
+        FROM functions
+        WHERE (modified, function_id) > (:after_modified, :after_id)
+        ORDER BY modified, function_id
+        LIMIT :limit
+        """
+    params = {"after_modified": after[0], "after_id": after[1], "limit": limit}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to list functions") from e
+    return result.all()
+
+
 def list_functions_by_user(user_id: UUID) -> list[Row]:
     query = """
         SELECT f.function_id as function_id, f.name as name, f.usecase as usecase, f.keywords as keywords, r.average as average FROM functions f
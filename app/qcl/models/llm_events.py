@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from sqlalchemy.engine import Row
+from qcl.utils import dbrunner, general
+
+# bounds between the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = [100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000]
+
+# events older than this many days are deleted, each web server worker checks once an hour
+LLM_EVENTS_RETENTION_DAYS = int(os.environ.get("LLM_EVENTS_RETENTION_DAYS", "90"))
+PRUNE_INTERVAL = 3600
+
+_pruned = None
+_prune_lock = threading.Lock()
+
+
+def save_event(
+    mode: str,
+    model: str,
+    outcome: str,
+    latency_ms: int,
+    error_class: str | None = None,
+    prompt_tokens: int | None = None,
+    completion_tokens: int | None = None,
+    truncated: bool | None = None,
+) -> None:
+    query = """
+        INSERT INTO llm_events (mode, model, outcome, error_class, latency_ms, prompt_tokens, completion_tokens, truncated)
+        VALUES (:mode, :model, :outcome, :error_class, :latency_ms, :prompt_tokens, :completion_tokens, :truncated)
+        """
+    params = {
+        "mode": mode,
+        "model": model,
+        "outcome": outcome,
+        "error_class": error_class,
+        "latency_ms": latency_ms,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "truncated": truncated,
+    }
+    try:
+        dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to log LLM event") from e
+    _prune_if_due()
+
+
+def prune() -> None:
+    "Delete events older than LLM_EVENTS_RETENTION_DAYS."
+
+    query = "DELETE FROM llm_events WHERE event_time <= :time_filter"
+    params = {
+        "time_filter": general.get_time_hours_ago(LLM_EVENTS_RETENTION_DAYS * 24)
+    }
+    try:
+        dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to delete old LLM events") from e
+
+
+def _prune_if_due() -> None:
+    global _pruned
+
+    with _prune_lock:
+        now = time.monotonic()
+        due = _pruned is None or now - _pruned >= PRUNE_INTERVAL
+        if due:
+            _pruned = now
+    if due:
+        prune()
+
+
+def summarize(since: int, by_day: bool = False) -> list[Row]:
+    """Requests, outcomes, latency and token usage per mode and model, since the given epoch time.
+    Latency percentiles only count requests that reached the LLM. With by_day, also grouped by UTC day.
+    """
+
+    day = (
+        "to_char(to_timestamp(event_time) AT TIME ZONE 'UTC', 'YYYY-MM-DD')"
+        if by_day
+        else "NULL"
+    )
+    query = f"""
+        SELECT {day} AS day, mode, model,
+        COUNT(*) AS requests,
+        COUNT(*) FILTER (WHERE outcome = 'cached') AS cached,
+        COUNT(*) FILTER (WHERE outcome = 'rejected') AS rejected,
+        COUNT(*) FILTER (WHERE outcome = 'invalid') AS invalid,
+        COUNT(*) FILTER (WHERE outcome = 'error') AS errors,
+        COUNT(*) FILTER (WHERE outcome = 'cancelled') AS cancelled,
+        COUNT(*) FILTER (WHERE truncated) AS truncated,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE outcome <> 'cached') AS p50_ms,
+        percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE outcome <> 'cached') AS p95_ms,
+        COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+        COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+        MAX(completion_tokens) AS max_completion_tokens
+        FROM llm_events
+        WHERE event_time > :since
+        GROUP BY 1, mode, model
+        ORDER BY 1, mode, model
+        """
+    params = {"since": since}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to summarize LLM events") from e
+    return result.all()
+
+
+def latency_histogram(since: int) -> list[Row]:
+    """Count of requests that reached the LLM per mode, model and latency bucket.
+    Bucket 0 is below the first bound of LATENCY_BUCKETS, bucket i starts from bound i-1.
+    """
+
+    query = """
+        SELECT mode, model, width_bucket(latency_ms, :buckets) AS bucket, COUNT(*) AS count
+        FROM llm_events
+        WHERE event_time > :since AND outcome <> 'cached'
+        GROUP BY mode, model, bucket
+        ORDER BY mode, model, bucket
+        """
+    params = {"since": since, "buckets": LATENCY_BUCKETS}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to summarize LLM events") from e
+    return result.all()
+
+
+def error_classes(since: int) -> list[Row]:
+    query = """
+        SELECT mode, model, error_class, COUNT(*) AS count
+        FROM llm_events
+        WHERE event_time > :since AND error_class IS NOT NULL
+        GROUP BY mode, model, error_class
+        ORDER BY mode, model, count DESC
+        """
+    params = {"since": since}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to summarize LLM events") from e
+    return result.all()
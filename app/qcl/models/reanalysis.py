@@ -0,0 +1,73 @@
+from sqlalchemy.engine import Row
+from qcl.utils import dbrunner, serialize
+
+
+def list_pending_functions(run_id: str, after_id: int, limit: int) -> list[Row]:
+    "List next functions, ordered by id, that have no results for the given run yet."
+
+    query = """
+        SELECT f.function_id as function_id, f.code as code
+        FROM functions AS f
+        WHERE f.function_id > :after_id
+        AND NOT EXISTS (
+            SELECT 1 FROM reanalysis_results AS r
+            WHERE r.run_id = :run_id AND r.function_id = f.function_id
+        )
+        ORDER BY f.function_id
+        LIMIT :limit
+        """
+    params = {"run_id": run_id, "after_id": after_id, "limit": limit}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to list functions") from e
+    return result.all()
+
+
+def count_pending_functions(run_id: str) -> int:
+    query = """
+        SELECT COUNT(*) FROM functions AS f
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reanalysis_results AS r
+            WHERE r.run_id = :run_id AND r.function_id = f.function_id
+        )
+        """
+    params = {"run_id": run_id}
+    try:
+        result = dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to count functions") from e
+    return result.scalar()
+
+
+def save_results(
+    run_id: str, function_id: int, results: dict[str, list | None]
+) -> None:
+    """Save results of all checks for one function, results are kept if the function was already done.
+    A check that failed has None as result.
+    """
+
+    query = """
+        INSERT INTO reanalysis_results (run_id, function_id, quick_count, lint_count, security_count, type_count, data, error)
+        VALUES (:run_id, :function_id, :quick_count, :lint_count, :security_count, :type_count, :data, :error)
+        ON CONFLICT (run_id, function_id) DO NOTHING
+        """
+    counts = {
+        check: None if result is None else len(result)
+        for check, result in results.items()
+    }
+    failed = [check for check, count in counts.items() if count is None]
+    params = {
+        "run_id": run_id,
+        "function_id": function_id,
+        "quick_count": counts["quick"],
+        "lint_count": counts["lint"],
+        "security_count": counts["security"],
+        "type_count": counts["type"],
+        "data": serialize.compress(results),
+        "error": f"Failed: {', '.join(failed)}" if failed else None,
+    }
+    try:
+        dbrunner.execute(query, params)
+    except Exception as e:
+        raise RuntimeError("Failed to save results") from e
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from typing import Any
+from qcl.utils import dbrunner, general, serialize
+
+# seconds between evictions by each web server worker, the cache may exceed its size limit in between
+RESULT_CACHE_EVICT_INTERVAL = int(os.environ.get("RESULT_CACHE_EVICT_INTERVAL", "60"))
+
+
+class ResultCache:
+    """Persistent cache for expensive results, shared by all web server workers.
+    Entries expire after max_age seconds, and least recently used entries are evicted
+    when there are more than max_entries of them, checked every RESULT_CACHE_EVICT_INTERVAL.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, max_age: int) -> None:
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evicted = None
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        "Return cached value, or None if there is no valid entry."
+
+        query = """
+            UPDATE result_cache
+            SET accessed=EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)
+            WHERE namespace=:namespace AND key=:key AND created > :time_filter
+            RETURNING data
+            """
+        params = {
+            "namespace": self.namespace,
+            "key": key,
+            "time_filter": general.get_time_seconds_ago(self.max_age),
+        }
+        try:
+            result = dbrunner.execute(query, params)
+        except Exception as e:
+            raise RuntimeError("Failed to read cached result") from e
+        row = result.first()
+
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return serialize.decompress(row.data)["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        "Store value to the cache, and evict expired and least recently used entries every now and then."
+
+        query = """
+            INSERT INTO result_cache (namespace, key, data)
+            VALUES (:namespace, :key, :data)
+            ON CONFLICT (namespace, key)
+            DO UPDATE SET data=:data,
+                created=EXTRACT(EPOCH FROM CURRENT_TIMESTAMP),
+                accessed=EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)
+            """
+        params = {
+            "namespace": self.namespace,
+            "key": key,
+            "data": serialize.compress({"value": value}),
+        }
+        try:
+            dbrunner.execute(query, params)
+        except Exception as e:
+            raise RuntimeError("Failed to save cached result") from e
+
+        with self.lock:
+            now = time.monotonic()
+            due = (
+                self.evicted is None
+                or now - self.evicted >= RESULT_CACHE_EVICT_INTERVAL
+            )
+            if due:
+                self.evicted = now
+        if due:
+            self.evict()
+
+    def evict(self) -> None:
+        "Delete expired entries, and least recently used entries exceeding the size limit."
+
+        query = """
+            DELETE FROM result_cache
+            WHERE namespace=:namespace AND (
+                created <= :time_filter
+                OR key IN (
+                    SELECT key FROM result_cache
+                    WHERE namespace=:namespace
+                    ORDER BY accessed DESC
+                    OFFSET :max_entries
+                )
+            )
+            """
+        params = {
+            "namespace": self.namespace,
+            "time_filter": general.get_time_seconds_ago(self.max_age),
+            "max_entries": self.max_entries,
+        }
+        try:
+            dbrunner.execute(query, params)
+        except Exception as e:
+            raise RuntimeError("Failed to evict cached results") from e
+
+    def stats(self) -> dict[str, int | float]:
+        "Return hit and miss counters of this web server worker."
+
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -142,6 +142,44 @@ function pyrightRowClicked(row) {
     highlightError(editor, marker_key, startline, endline, startcol + 1, endcol + 1);
 }
 
+// This function will highlight the corresponding row on code editor, when item on the quick check results table is clicked.
+function quickRowClicked(row) {
+
+    editor_container = document.getElementById("quick_box")
+    editor = ace.edit(editor_container)
+
+    // get the relevant cells
+    const cells = Array.from(row.cells);
+
+    // extract innerText from cells
+    const cellData = cells.map(cell => cell.innerText);
+
+    // extract values from cells
+    const startline = convert(cellData[3]);
+    var startcol = convert(cellData[4]);
+    var endline = convert(cellData[5]);
+    var endcol = convert(cellData[6]);
+
+    // set default values
+    if (endline === null || endline === undefined) {
+        var endline = startline;
+    }
+
+    if (endcol === null || endcol === undefined) {
+        var endcol = Infinity;
+    }
+
+    if (startcol === null || startcol === undefined) {
+        var startcol = 1;
+    }
+
+    // unique key for each editor
+    marker_key = 4
+
+    // apparently null indexing on lines, but not on columns
+    highlightError(editor, marker_key, startline, endline, startcol + 1, endcol + 1);
+}
+
 // This function will parse linting results table, and extract messages and relevant code locations
 // Output is in a format that can be used to set annotations in Ace editor
 function parse_lint_results() {
@@ -255,6 +293,43 @@ function parse_type_results() {
     return annotations;
 }
 
+// This function will parse quick check results table, and extract messages and relevant code locations
+// Output is in a format that can be used to set annotations in Ace editor
+function parse_quick_results() {
+    const rows = document.querySelectorAll('#quick-results tbody tr');
+    const annotations = [];
+
+    rows.forEach(row => {
+
+        // get cell data
+        const cells = row.querySelectorAll('td');
+
+        // extract values from cells
+        var severity = cells[0].innerText;
+        const message = cells[2].innerText;
+        const startLine = parseInt(cells[3].innerText, 10) - 1;
+
+        // convert to info/warning/error
+        if (severity == "information") {
+            type = "info"
+        } else if (severity == "warning") {
+            type = "warning"
+        } else {
+            type = "error"
+        }
+
+        // build annotation and add it to list
+        annotations.push({
+            row: startLine,
+            column: 0,
+            text: message,
+            type: type
+        });
+    });
+
+    return annotations;
+}
+
 // Function for adding new code editor
 function addEditor(editor_id, content, target_field = null, annotations = null) {
 
@@ -380,4 +455,198 @@ function setSpinner(formId) {
             .before(content)
             .hide();
     });
-}
\ No newline at end of file
+}
+
+// Functions for activating a results table and its code editor, once the results are on the page
+const resultInitializers = {
+    "quick": function (code) {
+        addRowHandler("quick-results", quickRowClicked)
+        makeDatatable("quick-results")
+        addEditor("quick_box", code, null, parse_quick_results())
+    },
+    "lint": function (code) {
+        addRowHandler("lint-results", pylintRowClicked)
+        makeDatatable("lint-results")
+        addEditor("lint_box", code, null, parse_lint_results())
+    },
+    "type": function (code) {
+        addRowHandler("type-results", pyrightRowClicked)
+
+        // render newlines in message field
+        var columns = [
+            null,
+            {
+                "render": function (data, type, row) {
+                    return data.split("\n").join("<br/>");
+                }
+            },
+            null,
+            null,
+            null,
+            null
+        ]
+        makeDatatable("type-results", columns)
+        addEditor("type_box", code, null, parse_type_results())
+    },
+    "security": function (code) {
+        addRowHandler("security-results", banditRowClicked)
+        makeDatatable("security-results")
+        addEditor("security_box", code, null, parse_security_results())
+    }
+}
+
+// Function for activating results of the given check, if there are any
+function initResults(tool, code) {
+    if (document.getElementById(tool + "-results") != null) {
+        resultInitializers[tool](code);
+    }
+}
+
+// Function for polling a background job, until it's done
+function pollJob(url, onUpdate, onError, interval = 500) {
+    jQuery.ajax({
+        url: url,
+        type: 'GET',
+        success: function (response) {
+            onUpdate(response);
+            if (!response.done) {
+                setTimeout(function () {
+                    pollJob(url, onUpdate, onError, interval);
+                }, interval);
+            }
+        },
+        error: onError
+    });
+}
+
+// Function for showing results of the slower checks on their tabs, as soon as each one finishes
+function loadChecks(url, code) {
+    const tools = ["lint", "type", "security"];
+    const shown = new Set();
+
+    // show the failure on every tab that is still waiting
+    function showFailure() {
+        for (const tool of tools) {
+            if (!shown.has(tool)) {
+                jQuery("#" + tool + "-badge").removeClass("text-bg-secondary").addClass("text-bg-danger").text("failed");
+                jQuery("#" + tool + "-content").html("<p>Failed to run the check, please try again.</p>");
+            }
+        }
+    }
+
+    pollJob(url, function (response) {
+
+        // each check comes with its rendered results and issue count
+        for (const [tool, check] of Object.entries(response.checks)) {
+            if (shown.has(tool)) {
+                continue;
+            }
+            if (check.failed) {
+                jQuery("#" + tool + "-badge").removeClass("text-bg-secondary").addClass("text-bg-danger").text("failed");
+            } else if (check.timed_out) {
+                jQuery("#" + tool + "-badge").removeClass("text-bg-secondary").addClass("text-bg-warning").text("timed out");
+            } else {
+                jQuery("#" + tool + "-badge").text(check.count);
+            }
+            jQuery("#" + tool + "-content").html(check.html);
+            initResults(tool, code);
+            shown.add(tool);
+        }
+
+        if (response.failed) {
+            showFailure();
+        }
+    }, showFailure);
+}
+
+// Function for showing unit test results, once the tests have finished
+function loadTestResults(url) {
+
+    function showFailure() {
+        jQuery("#test-content").html("<p>Failed to run unit tests, please try again.</p>");
+    }
+
+    pollJob(url, function (response) {
+        if (!response.done) {
+            return;
+        }
+        if (response.html == null) {
+            showFailure();
+            return;
+        }
+        jQuery("#test-content").html(response.html);
+
+        if (document.getElementById("test-results") != null) {
+            // render newlines in message field
+            var columns = [
+                {
+                    "render": function (data, type, row) {
+                        return data.split("\n").join("<br/>");
+                    }
+                }
+            ]
+            makeDatatable("test-results", columns)
+        }
+    }, showFailure);
+}
+
+// Function for generating code with the LLM, showing the response in an editor as it arrives
+// Takes over the given submit button, the form is still submitted normally if fetch isn't available
+function streamCode(button_id, url, source_editor_id, target_editor_id) {
+    if (!window.fetch) {
+        return;
+    }
+
+    const button = document.getElementById(button_id);
+    button.addEventListener("click", async function (event) {
+        event.preventDefault();
+
+        const source = ace.edit(source_editor_id).getValue();
+        const target = ace.edit(target_editor_id);
+        target.setValue("");
+
+        // put the button back, setSpinner has replaced it with a spinner
+        function restoreButton() {
+            jQuery(button).prev().remove();
+            jQuery(button).attr("value", button.defaultValue).show();
+        }
+
+        function showFailure() {
+            restoreButton();
+            alert("Failed to generate code.");
+        }
+
+        try {
+            // generation runs in the background, the response so far is polled from the job
+            const response = await fetch(url, {
+                method: "POST",
+                body: new URLSearchParams({ "source_code": source })
+            });
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            const job = await response.json();
+
+            pollJob(job.url, function (generated) {
+                if (!generated.done) {
+                    if (generated.text) {
+                        target.setValue(generated.text);
+                        target.clearSelection();
+                    }
+                    return;
+                }
+                if (generated.error) {
+                    target.setValue("");
+                    alert(generated.error);
+                } else {
+                    // replace the raw response with the extracted code
+                    target.setValue(generated.code);
+                    target.clearSelection();
+                }
+                restoreButton();
+            }, showFailure, 300);
+        } catch (error) {
+            showFailure();
+        }
+    });
+}
@@ -0,0 +1,443 @@
+import ast
+import builtins
+
+# builtins that only evaluate or execute code given as string
+DYNAMIC_EXECUTION = {"exec", "eval"}
+
+# code using any of these is rejected without asking the LLM
+DANGEROUS_BUILTINS = DYNAMIC_EXECUTION | {"__import__"}
+DANGEROUS_MODULES = {"subprocess"}
+DANGEROUS_ATTRIBUTES = {
+    ("os", "system"),
+    ("os", "popen"),
+    *(("builtins", name) for name in DANGEROUS_BUILTINS),
+}
+
+# code using only these is accepted without asking the LLM
+SAFE_BUILTINS = {
+    "abs",
+    "all",
+    "any",
+    "bool",
+    "bytes",
+    "chr",
+    "dict",
+    "divmod",
+    "enumerate",
+    "filter",
+    "float",
+    "format",
+    "frozenset",
+    "int",
+    "isinstance",
+    "len",
+    "list",
+    "map",
+    "max",
+    "min",
+    "ord",
+    "pow",
+    "print",
+    "range",
+    "reversed",
+    "round",
+    "set",
+    "sorted",
+    "str",
+    "sum",
+    "tuple",
+    "zip",
+} | {
+    name
+    for name, value in vars(builtins).items()
+    if isinstance(value, type) and issubclass(value, BaseException)
+}
+SAFE_MODULES = {"math", "cmath", "decimal", "fractions", "statistics"}
+# only the test case class of unittest and its assertions are safe,
+# loaders, main and mock import and call anything given by name
+SAFE_UNITTEST_NAMES = {"unittest.TestCase"}
+
+# code using only these gives the same results on every run
+DETERMINISTIC_MODULES = SAFE_MODULES | {
+    "unittest",
+    "bisect",
+    "collections",
+    "copy",
+    "dataclasses",
+    "enum",
+    "functools",
+    "heapq",
+    "itertools",
+    "json",
+    "operator",
+    "re",
+    "string",
+    "textwrap",
+    "typing",
+}
+# results of these vary between runs, come from outside, or can't be seen from the code
+NONDETERMINISTIC_BUILTINS = DANGEROUS_BUILTINS | {"hash", "id", "input", "open"}
+
+# calls that create a new mutable object
+MUTABLE_CALLS = {"list", "dict", "set", "bytearray"}
+
+# types that are accepted where the annotated type is expected, following the numeric tower
+COMPATIBLE_TYPES = {
+    "float": {"float", "int", "bool"},
+    "complex": {"complex", "float", "int", "bool"},
+    "int": {"int", "bool"},
+    "object": None,
+}
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+
+
+def _issue(
+    node: ast.AST, check: str, severity: str, message: str
+) -> dict[str, str | int]:
+    "Create issue in the format shown on the UI, with 1-based lines and 0-based columns."
+
+    issue = {}
+    issue["check"] = check
+    issue["severity"] = severity
+    issue["message"] = message
+    issue["line"] = node.lineno
+    issue["endLine"] = node.end_lineno
+    issue["col"] = node.col_offset
+    issue["endCol"] = node.end_col_offset
+    return issue
+
+
+def _literal_type(node: ast.expr | None) -> str | None:
+    "Name of the type of a literal expression, None if the expression is not a literal."
+
+    if node is None:
+        return "None"
+    if isinstance(node, ast.Constant):
+        if node.value is None:
+            return "None"
+        if node.value is Ellipsis:
+            return None
+        return type(node.value).__name__
+    if isinstance(node, ast.JoinedStr):
+        return "str"
+    if isinstance(node, (ast.List, ast.ListComp)):
+        return "list"
+    if isinstance(node, (ast.Dict, ast.DictComp)):
+        return "dict"
+    if isinstance(node, (ast.Set, ast.SetComp)):
+        return "set"
+    if isinstance(node, ast.Tuple):
+        return "tuple"
+    return None
+
+
+def _annotated_types(node: ast.expr) -> set[str] | None:
+    """Names of the types allowed by a return annotation, None if the annotation is too complex to compare.
+    Supports builtin names, generic aliases like list[int], unions with | and Optional.
+    """
+
+    if isinstance(node, ast.Constant) and node.value is None:
+        return {"None"}
+    if isinstance(node, ast.Name):
+        if node.id in COMPATIBLE_TYPES:
+            allowed = COMPATIBLE_TYPES[node.id]
+            return None if allowed is None else set(allowed)
+        if node.id in {"str", "bytes", "bool", "list", "dict", "set", "tuple"}:
+            return {node.id}
+        if node.id == "None":
+            return {"None"}
+        return None
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        left = _annotated_types(node.left)
+        right = _annotated_types(node.right)
+        if left is None or right is None:
+            return None
+        return left | right
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+        if node.value.id == "Optional":
+            inner = _annotated_types(node.slice)
+            return None if inner is None else inner | {"None"}
+        return _annotated_types(node.value)
+    return None
+
+
+def _own_nodes(function: ast.FunctionDef | ast.AsyncFunctionDef):
+    "Walk the body of a function, without descending into nested functions and classes."
+
+    stack = list(function.body)
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, FUNCTION_NODES + (ast.ClassDef,)):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def _is_method(function: ast.AST, parents: dict[ast.AST, ast.AST]) -> bool:
+    return isinstance(parents.get(function), ast.ClassDef)
+
+
+def _check_annotations(function, parents) -> list[dict]:
+    "Report arguments and return values without type annotation."
+
+    issues = []
+    arguments = function.args.posonlyargs + function.args.args
+    # self and cls are typed implicitly
+    if _is_method(function, parents) and arguments:
+        decorators = {getattr(d, "id", None) for d in function.decorator_list}
+        if "staticmethod" not in decorators:
+            arguments = arguments[1:]
+    arguments = arguments + function.args.kwonlyargs
+    for arg in (function.args.vararg, function.args.kwarg):
+        if arg is not None:
+            arguments.append(arg)
+
+    for arg in arguments:
+        if arg.annotation is None:
+            issues.append(
+                _issue(
+                    arg,
+                    "missing-annotation",
+                    "information",
+                    f'Argument "{arg.arg}" of "{function.name}" has no type annotation',
+                )
+            )
+    if function.returns is None and function.name != "__init__":
+        issues.append(
+            _issue(
+                function,
+                "missing-annotation",
+                "information",
+                f'Function "{function.name}" has no return type annotation',
+            )
+        )
+    return issues
+
+
+def _check_mutable_defaults(function) -> list[dict]:
+    "Report default values that are shared between calls, but can be modified."
+
+    issues = []
+    for default in function.args.defaults + function.args.kw_defaults:
+        if default is None:
+            continue
+        mutable = isinstance(
+            default,
+            (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp),
+        ) or (
+            isinstance(default, ast.Call)
+            and isinstance(default.func, ast.Name)
+            and default.func.id in MUTABLE_CALLS
+        )
+        if mutable:
+            issues.append(
+                _issue(
+                    default,
+                    "mutable-default",
+                    "warning",
+                    f'Mutable default value in "{function.name}" is shared between calls, use None instead',
+                )
+            )
+    return issues
+
+
+def _check_returns(function) -> list[dict]:
+    "Report literal return values that don't match the return type annotation."
+
+    if function.returns is None:
+        return []
+    allowed = _annotated_types(function.returns)
+    if allowed is None:
+        return []
+
+    issues = []
+    for node in _own_nodes(function):
+        if isinstance(node, ast.Return):
+            returned = _literal_type(node.value)
+            if returned is not None and returned not in allowed:
+                issues.append(
+                    _issue(
+                        node,
+                        "return-type-mismatch",
+                        "error",
+                        f'Returns "{returned}", but "{function.name}" is annotated to return "{ast.unparse(function.returns)}"',
+                    )
+                )
+    return issues
+
+
+def check_source(source_code: str) -> list[dict[str, str | int]]:
+    """Run quick checks, which only need the syntax tree and finish in milliseconds.
+    Raises SyntaxError if the source code can't be parsed.
+    """
+
+    parsed = ast.parse(source_code)
+
+    parents = {}
+    for node in ast.walk(parsed):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+
+    issues = []
+    for node in ast.walk(parsed):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            issues.extend(_check_annotations(node, parents))
+            issues.extend(_check_mutable_defaults(node))
+            issues.extend(_check_returns(node))
+
+        elif isinstance(node, ast.Call) and (
+            (isinstance(node.func, ast.Name) and node.func.id in DYNAMIC_EXECUTION)
+            or (
+                isinstance(node.func, ast.Attribute)
+                and node.func.attr in DYNAMIC_EXECUTION
+                and isinstance(node.func.value, ast.Name)
+                and node.func.value.id == "builtins"
+            )
+        ):
+            name = getattr(node.func, "id", None) or node.func.attr
+            issues.append(
+                _issue(
+                    node,
+                    "dynamic-execution",
+                    "error",
+                    f'Use of "{name}" runs arbitrary code, avoid it',
+                )
+            )
+
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            issues.append(
+                _issue(
+                    node,
+                    "bare-except",
+                    "warning",
+                    "Bare except also catches KeyboardInterrupt and SystemExit, name the exceptions",
+                )
+            )
+
+    issues.sort(key=lambda issue: (issue["line"], issue["col"]))
+    return issues
+
+
+def _module_aliases(parsed: ast.AST) -> dict[str, str]:
+    "Map names bound by imports to what they refer to, like np to numpy or system to os.system."
+
+    aliases = {}
+    for node in ast.walk(parsed):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+                else:
+                    root = alias.name.split(".")[0]
+                    aliases[root] = root
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+    return aliases
+
+
+def _qualified_name(node: ast.expr, aliases: dict[str, str]) -> str | None:
+    "Full name of a name or attribute chain, like numpy.linalg.norm for np.linalg.norm."
+
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(aliases.get(node.id, node.id))
+    return ".".join(reversed(parts))
+
+
+def _is_safe_unittest(name: str) -> bool:
+    "Tell if the name is the test case class of unittest, or one of its assertions."
+
+    parent, _, attribute = name.rpartition(".")
+    return name in SAFE_UNITTEST_NAMES or (
+        parent in SAFE_UNITTEST_NAMES and attribute.startswith("assert")
+    )
+
+
+def prescreen(source_code: str) -> str | None:
+    """Moderate clearly safe or clearly dangerous code without the LLM.
+    Returns "safe" if the code only imports and calls allowlisted modules and builtins,
+    "dangerous" if it executes dynamic code or commands, and None if the LLM has to decide.
+    Raises SyntaxError if the source code can't be parsed.
+    """
+
+    parsed = ast.parse(source_code)
+    aliases = _module_aliases(parsed)
+    attribute_bases = {
+        node.value for node in ast.walk(parsed) if isinstance(node, ast.Attribute)
+    }
+
+    dangerous = False
+    ambiguous = False
+    for node in ast.walk(parsed):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            else:
+                # relative imports have no module
+                modules = [node.module or ""]
+                dangerous |= any(
+                    (node.module, alias.name) in DANGEROUS_ATTRIBUTES
+                    for alias in node.names
+                )
+            for module in modules:
+                root = module.split(".")[0]
+                dangerous |= root in DANGEROUS_MODULES
+                if module != "unittest":
+                    ambiguous |= root not in SAFE_MODULES
+                elif isinstance(node, ast.ImportFrom):
+                    ambiguous |= not all(
+                        _is_safe_unittest(f"unittest.{alias.name}")
+                        for alias in node.names
+                    )
+
+        elif isinstance(node, ast.Name):
+            if node.id in DANGEROUS_BUILTINS:
+                dangerous = True
+            # other names are local, imported or the function under test
+            elif hasattr(builtins, node.id) and node.id not in SAFE_BUILTINS:
+                ambiguous = True
+            # the unittest module itself is only used to reach the test case class
+            elif aliases.get(node.id) == "unittest" and node not in attribute_bases:
+                ambiguous = True
+
+        elif isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name):
+                module = aliases.get(node.value.id, node.value.id)
+                dangerous |= (module, node.attr) in DANGEROUS_ATTRIBUTES
+            # dunder attributes lead to anything, like ().__class__.__base__.__subclasses__()
+            ambiguous |= node.attr.startswith("_")
+            name = _qualified_name(node, aliases)
+            if name is not None and name.startswith("unittest."):
+                ambiguous |= not _is_safe_unittest(name)
+
+    if dangerous:
+        return "dangerous"
+    if ambiguous:
+        return None
+    return "safe"
+
+
+def is_deterministic(source_code: str) -> bool:
+    """Tell if the code gives the same results on every run, as far as can be seen without running it.
+    False if it imports anything but known deterministic modules, or uses builtins like id().
+    Raises SyntaxError if the source code can't be parsed.
+    """
+
+    for node in ast.walk(ast.parse(source_code)):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            # relative imports have no module
+            modules = [node.module or ""]
+        elif isinstance(node, ast.Name) and node.id in NONDETERMINISTIC_BUILTINS:
+            return False
+        else:
+            continue
+        if any(module.split(".")[0] not in DETERMINISTIC_MODULES for module in modules):
+            return False
+    return True
@@ -2,10 +2,16 @@ import tempfile
 import os
 
 
-def create_tempfile(content: str):
+# memory-backed filesystem, if available
+MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def create_tempfile(content: str, dir: str | None = None):
     "Create a temporary file with .py extension, and return its name."
 
-    with tempfile.NamedTemporaryFile(mode="w+", suffix=".py", delete=False) as tmpfile:
+    with tempfile.NamedTemporaryFile(
+        mode="w+", suffix=".py", dir=dir, delete=False
+    ) as tmpfile:
         tmpfile.write(content)
         tmpfile_name = tmpfile.name
     return tmpfile_name
@@ -1,3 +1,4 @@
+import hashlib
 import time
 from flask import request
 
@@ -27,3 +28,13 @@ def get_remote_ip() -> str:
         return request.headers["X-Forwarded-For"]
     else:
         return request.remote_addr
+
+
+def digest(*parts: str) -> str:
+    "Hash of the given strings, to tell if they have changed without storing them."
+
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
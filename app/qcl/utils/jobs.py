@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import uuid
+from qcl import app, cache
+
+# number of jobs run concurrently by each web server worker
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+
+# speculative jobs, like prefetching, have their own smaller pool, so they don't hold up the jobs users wait for
+SPECULATIVE_JOB_WORKERS = int(os.environ.get("SPECULATIVE_JOB_WORKERS", "2"))
+
+# how long job state is kept after the last update, in seconds
+JOB_TTL = int(os.environ.get("JOB_TTL", "600"))
+
+# the executors are created lazily, separately in each web server worker
+_executors = {}
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(speculative: bool) -> ThreadPoolExecutor:
+    global _executors, _executor_pid
+
+    with _executor_lock:
+        # threads don't survive forking
+        if _executor_pid != os.getpid():
+            _executors = {}
+            _executor_pid = os.getpid()
+        if speculative not in _executors:
+            _executors[speculative] = ThreadPoolExecutor(
+                max_workers=SPECULATIVE_JOB_WORKERS if speculative else JOB_WORKERS,
+                thread_name_prefix="speculative-job" if speculative else "job",
+            )
+        return _executors[speculative]
+
+
+def _key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _save(job_id: str, state: dict) -> None:
+    "Publish job state, it's kept in the shared cache so any web server worker can serve it."
+
+    cache.set(_key(job_id), state, timeout=JOB_TTL)
+
+
+def _run(job_id: str, state: dict, func, args: tuple) -> None:
+    def report(name: str, value) -> None:
+        state["progress"][name] = value
+        _save(job_id, state)
+
+    state["status"] = "running"
+    _save(job_id, state)
+    try:
+        state["result"] = func(*args, report=report)
+        state["status"] = "done"
+    except Exception:
+        app.logger.exception("Job failed")
+        state["status"] = "failed"
+    _save(job_id, state)
+
+
+def submit(owner, func, *args, speculative: bool = False) -> str:
+    """Run func(*args, report=report) in the background, return id of the job right away.
+    The function can publish partial results with report(name, value) while it runs.
+    Speculative jobs run in a separate pool, they never delay the others.
+    """
+
+    job_id = uuid.uuid4().hex
+    state = {"owner": str(owner), "status": "pending", "progress": {}, "result": None}
+    _save(job_id, state)
+    _get_executor(speculative).submit(_run, job_id, state, func, args)
+    return job_id
+
+
+def get(job_id: str, owner) -> dict | None:
+    "Return state of the job, None if it doesn't exist, has expired or belongs to someone else."
+
+    state = cache.get(_key(job_id))
+    if state is None or state["owner"] != str(owner):
+        return None
+    return state
+
+
+def is_finished(state: dict) -> bool:
+    return state["status"] in ("done", "failed")
@@ -0,0 +1,243 @@
+from collections import Counter
+import keyword
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from qcl import app
+from qcl.models import function
+
+# length of the hashed feature vectors
+FEATURES = 2**11
+
+# number of most similar functions that vote for the keywords
+KEYWORD_NEIGHBOURS = int(os.environ.get("KEYWORD_NEIGHBOURS", "5"))
+
+# suggest at most this many keywords, and only ones with enough votes compared to the best one
+MAX_KEYWORDS = 5
+MIN_RELATIVE_SCORE = 0.3
+
+# seconds after which the library model is built from scratch, to forget deleted functions
+KEYWORD_MODEL_TTL = int(os.environ.get("KEYWORD_MODEL_TTL", "3600"))
+
+# seconds between checks for new and edited functions
+KEYWORD_REFRESH_INTERVAL = float(os.environ.get("KEYWORD_REFRESH_INTERVAL", "10"))
+
+# functions read from database at once
+BATCH_SIZE = 500
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+")
+
+
+def tokens(source_code: str) -> list[str]:
+    "Words of identifiers, comments and strings, with snake_case and camelCase split apart."
+
+    words = []
+    for identifier in IDENTIFIER.findall(source_code):
+        if keyword.iskeyword(identifier):
+            continue
+        for word in WORD.findall(identifier):
+            if len(word) > 1:
+                words.append(word.lower())
+    return words
+
+
+def vectorize(source_code: str) -> np.ndarray:
+    "Hashed counts of words and pairs of consecutive words, log scaled."
+
+    vector = np.zeros(FEATURES, dtype=np.float32)
+    words = tokens(source_code)
+    pairs = [f"{first} {second}" for first, second in zip(words, words[1:])]
+    for feature in words + pairs:
+        # stable across processes, unlike hash()
+        vector[zlib.crc32(feature.encode("utf-8")) % FEATURES] += 1
+    return np.log1p(vector)
+
+
+def parse_keywords(keywords: str) -> list[str]:
+    "Split keywords as stored with functions."
+
+    return [k.strip().lower() for k in keywords.split(",") if k.strip()]
+
+
+class KeywordModel:
+    """Nearest neighbour classifier over tf-idf weighted feature vectors of code.
+    Functions can be added at any time, suggestions use all functions added so far.
+    """
+
+    def __init__(self) -> None:
+        # rows beyond count are unused capacity
+        self.vectors = np.zeros((0, FEATURES), dtype=np.float32)
+        self.document_frequency = np.zeros(FEATURES, dtype=np.float32)
+        self.keywords = []
+        self.count = 0
+        # row of each function added with an id
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def add(
+        self, functions: list[tuple[str, str]], function_ids: list[int] | None = None
+    ) -> None:
+        """Add (code, keywords) pairs, keywords comma separated.
+        A function added again with the same id replaces the earlier version.
+        """
+
+        if not functions:
+            return
+        vectors = np.stack([vectorize(code) for code, _ in functions])
+        with self.lock:
+            rows = []
+            needed = self.count
+            for function_id in function_ids or [None] * len(functions):
+                row = self.rows.get(function_id)
+                if row is None:
+                    row = needed
+                    needed += 1
+                    if function_id is not None:
+                        self.rows[function_id] = row
+                rows.append(row)
+            replaced = [row for row in rows if row < self.count]
+
+            if needed > len(self.vectors):
+                # grow geometrically, so that adding one function at a time stays cheap
+                grown = np.zeros(
+                    (max(needed, 2 * len(self.vectors)), FEATURES), dtype=np.float32
+                )
+                grown[: self.count] = self.vectors[: self.count]
+                self.vectors = grown
+            elif replaced:
+                # suggestions running without the lock keep reading the old rows
+                self.vectors = self.vectors.copy()
+            self.document_frequency -= (self.vectors[replaced] > 0).sum(axis=0)
+            self.vectors[rows] = vectors
+            self.document_frequency += (vectors > 0).sum(axis=0)
+            self.keywords.extend([] for _ in range(needed - self.count))
+            for row, (_, keywords) in zip(rows, functions):
+                self.keywords[row] = parse_keywords(keywords)
+            self.count = needed
+
+    def suggest(self, source_code: str) -> list[str]:
+        "Suggest keywords used by the most similar functions, best first."
+
+        with self.lock:
+            vectors = self.vectors[: self.count]
+            document_frequency = self.document_frequency.copy()
+            keywords = self.keywords[: self.count]
+        if not keywords:
+            return []
+
+        # rare words tell more about the function
+        idf = np.log((1 + len(keywords)) / (1 + document_frequency)) + 1
+        query = vectorize(source_code) * idf
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        weighted = vectors * idf
+        norms = np.linalg.norm(weighted, axis=1) * query_norm
+        similarity = weighted @ query / np.where(norms == 0, 1, norms)
+
+        # each neighbour votes for its keywords, weighted by similarity
+        scores = Counter()
+        for index in np.argsort(-similarity)[:KEYWORD_NEIGHBOURS]:
+            if similarity[index] <= 0:
+                break
+            for word in keywords[index]:
+                scores[word] += float(similarity[index])
+        if not scores:
+            return []
+        best = scores.most_common(1)[0][1]
+        return [
+            word
+            for word, score in scores.most_common(MAX_KEYWORDS)
+            if score >= best * MIN_RELATIVE_SCORE
+        ]
+
+
+# model of the library, kept separately in each web server worker
+_model = KeywordModel()
+# (modified, function_id) of the last function read
+_cursor = (0, 0)
+_built = None
+_refresh_lock = threading.Lock()
+
+# the model is kept up to date by a background thread, started lazily in each web server worker
+_wake = None
+_updater_pid = None
+_updater_lock = threading.Lock()
+
+
+def _catch_up(model: KeywordModel, cursor: tuple[int, int]) -> tuple[int, int]:
+    "Add functions saved or edited after the cursor to the model, return the new cursor."
+
+    while rows := function.list_keyword_corpus(cursor, BATCH_SIZE):
+        model.add(
+            [(row.code, row.keywords) for row in rows],
+            [row.function_id for row in rows],
+        )
+        cursor = (rows[-1].modified, rows[-1].function_id)
+    return cursor
+
+
+def refresh() -> None:
+    """Add functions saved or edited since the last refresh, by any web server worker.
+    The whole model is rebuilt when it's older than KEYWORD_MODEL_TTL.
+    """
+
+    global _model, _cursor, _built
+
+    with _refresh_lock:
+        if _built is None or time.monotonic() - _built > KEYWORD_MODEL_TTL:
+            model = KeywordModel()
+            cursor = _catch_up(model, (0, 0))
+            # a rebuilt model replaces the old one only once it's complete
+            _model = model
+            _cursor = cursor
+            _built = time.monotonic()
+        else:
+            _cursor = _catch_up(_model, _cursor)
+
+
+def _update(wake: threading.Event) -> None:
+    while True:
+        wake.clear()
+        try:
+            refresh()
+        except Exception:
+            app.logger.exception("Failed to refresh keyword classifier")
+        wake.wait(KEYWORD_REFRESH_INTERVAL)
+
+
+def _start_updater() -> bool:
+    "Start the background thread of this web server worker, unless it's running. True if started now."
+
+    global _wake, _updater_pid
+
+    with _updater_lock:
+        # threads don't survive forking
+        if _updater_pid == os.getpid():
+            return False
+        _wake = threading.Event()
+        threading.Thread(
+            target=_update, args=(_wake,), name="keyword-model", daemon=True
+        ).start()
+        _updater_pid = os.getpid()
+        return True
+
+
+def schedule_refresh() -> None:
+    "Have the model pick up new and edited functions soon, without waiting for it."
+
+    if not _start_updater():
+        _wake.set()
+
+
+def suggest(source_code: str) -> list[str]:
+    """Suggest keywords for the source code, from similar functions in the library.
+    Uses the model as it is, it's kept up to date in the background.
+    """
+
+    _start_updater()
+    return _model.suggest(source_code)
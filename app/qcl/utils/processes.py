@@ -0,0 +1,6 @@
+import threading
+
+# Forking while another thread is starting a subprocess leaks the subprocess' internal pipes
+# to the forked child, which can make the other thread hang forever.
+# Hold this lock while doing either.
+fork_lock = threading.Lock()
@@ -1,8 +1,10 @@
 from functools import wraps
+import time
 from uuid import UUID
 from flask import (
     abort,
     g,
+    get_template_attribute,
     make_response,
     redirect,
     render_template,
@@ -12,11 +14,17 @@ from flask import (
 )
 
 from qcl import app
-from qcl.integrations import gpt, linter, testrunner, security, typecheck
-from qcl.models import user as user_module, function, ratings, search as search_module
+from qcl.integrations import analysis, gpt, llm_guard, prefetch, testrunner
+from qcl.models import (
+    user as user_module,
+    function,
+    llm_events,
+    ratings,
+    search as search_module,
+)
 from qcl.models.session import server_session
 from qcl.models.user import User
-from qcl.utils import code_format, fileops
+from qcl.utils import ast_checks, code_format, general, jobs, keyword_classifier
 from qcl.views.forms import (
     ClassifyForm,
     CodeForm,
@@ -64,6 +72,11 @@ def user_context():
     return {"username": getattr(g.get("user"), "name", None)}
 
 
+@app.context_processor
+def llm_context():
+    return {"one_shot": gpt.ONE_SHOT}
+
+
 ### SESSION HANDLING
 @app.before_request
 def pre_request():
@@ -300,6 +313,37 @@ def register():
 
 
 ### APP FUNCTIONALITY
+def _get_prefetched(documented: str) -> dict[str, str]:
+    "Results generated in advance, if they were based on the given documented code."
+
+    source_code = server_session.get("source_code")
+    if not source_code:
+        return {}
+    prefetched = prefetch.get(g.psql_session_id, g.user.id, source_code)
+    if prefetched.get("documented") != documented:
+        return {}
+    return prefetched
+
+
+def _get_one_shot(documented: str) -> dict[str, str]:
+    "Tests and keywords generated with the documentation in one-shot mode, if it's still the same documentation."
+
+    one_shot = server_session.get("source_code_one_shot")
+    if not one_shot or one_shot["digest"] != general.digest(documented):
+        return {}
+    return one_shot
+
+
+def _suggest_keywords(documented: str) -> str:
+    "Keywords of similar functions in the library, empty if there are none."
+
+    try:
+        return ", ".join(keyword_classifier.suggest(documented))
+    except Exception:
+        app.logger.exception("Failed to suggest keywords")
+        return ""
+
+
 @app.route("/add", methods=["GET", "POST"])
 @needs_user
 def add():
@@ -321,19 +365,21 @@ def add():
                     error = "SyntaxError: " + str(e)
                     return render_template("add.html.j2", form=form, error=error)
 
-                filename = fileops.create_tempfile(source_code)
-                try:
-                    lint_result = linter.run_pylint(filename)
-                    security_result = security.run_bandit(filename)
-                    type_result = typecheck.run_pyright(filename)
-                finally:
-                    fileops.delete_file(filename)
+                # prepare the next steps while user reviews the results
+                prefetch.start(g.psql_session_id, g.user.id, source_code)
+
+                # show quick checks right away, the rest run in the background
+                quick_result = ast_checks.check_source(source_code)
+                job_id = jobs.submit(g.user.id, analysis.run_checks, source_code)
+
+                # results are kept in session once ready, to be saved with the function
+                server_session["source_code_checks"] = {
+                    "job_id": job_id,
+                    "digest": general.digest(source_code),
+                    "result": None,
+                }
                 return render_template(
-                    "add.html.j2",
-                    form=form,
-                    lint_result=lint_result,
-                    security_result=security_result,
-                    type_result=type_result,
+                    "add.html.j2", form=form, quick_result=quick_result, job_id=job_id
                 )
 
             elif form.doc.data:  # clicked next
@@ -343,6 +389,7 @@ def add():
                 except SyntaxError as e:
                     error = "SyntaxError: " + str(e)
                     return render_template("add.html.j2", form=form, error=error)
+                prefetch.start(g.psql_session_id, g.user.id, source_code)
                 return redirect(url_for("doc"))
 
             else:  # unexpected submit
@@ -361,12 +408,32 @@ def doc():
             form.code.data = source_code
         if documented := server_session.get("source_code_documented"):
             form.documented.data = documented
+        elif source_code:
+            # documentation may have been generated in advance
+            prefetched = prefetch.get(g.psql_session_id, g.user.id, source_code)
+            form.documented.data = prefetched.get("documented")
         return render_template("doc.html.j2", form=form)
 
     elif request.method == "POST":
         if form.generate.data:  # clicked generate tests
             try:
-                documented = gpt.enhance_code(form.code.data, mode="doc")
+                if gpt.ONE_SHOT:
+                    # tests and keywords come with the same response, keep them for the next steps
+                    enhancements = gpt.enhance_all(form.code.data)
+                    documented = enhancements["documented"]
+                    unittests = enhancements["unittests"]
+                    # only valid while the documentation stays the same
+                    server_session["source_code_one_shot"] = {
+                        "digest": general.digest(documented),
+                        "unittests": unittests,
+                        "keywords": ", ".join(enhancements["keywords"]),
+                    }
+                    # moderation was part of the response, no need to repeat it when saving
+                    server_session["source_code_moderated"] = general.digest(
+                        documented, unittests
+                    )
+                else:
+                    documented = gpt.enhance_code(form.code.data, mode="doc")
                 error = False
             except ValueError:
                 error = "Your source code was rejected."
@@ -410,6 +477,12 @@ def test():
             form.documented.data = documented
         if unittests := server_session.get("source_code_unittests"):
             form.unittests.data = unittests
+        elif documented:
+            # tests may have been generated with or in advance of the same documentation
+            form.unittests.data = (
+                _get_one_shot(documented).get("unittests")
+                or _get_prefetched(documented).get("unittests")
+            )
         return render_template("test.html.j2", form=form)
 
     if request.method == "POST":
@@ -439,33 +512,26 @@ def test():
             except SyntaxError as e:
                 error = "SyntaxError: " + str(e)
                 return render_template("test.html.j2", form=form, error=error)
-            try:
-                results = testrunner.execute(func=documented, test=unittests)
-                failures = results["failures"]
-                errors = results["errors"]
-                skipped = results["skipped"]
-                failures.extend(errors)
+            # a run of the same tests that is still going on is waited for, instead of starting another
+            digest = general.digest(documented, unittests)
+            test_run = server_session.get("source_code_test_run")
+            if test_run and test_run["digest"] == digest and test_run["result"] is None:
+                job = jobs.get(test_run["job_id"], g.user.id)
+                if job is not None and not jobs.is_finished(job):
+                    return render_template(
+                        "test.html.j2", form=form, job_id=test_run["job_id"]
+                    )
 
-                if not failures and not results["successful"]:
-                    failures = ["Failed to run unit tests"]
+            # tests run in the background, the page fetches results from /api/tests
+            job_id = jobs.submit(g.user.id, testrunner.run_tests, documented, unittests)
 
-                fail_count = len(errors) + len(failures) + len(skipped)
-                ok_count = results["total"] - fail_count
-                error = False
-            except Exception:
-                error = "Failed to run unit tests"
-                app.logger.exception(error)
-                failures = [error]
-                ok_count = 0
-                fail_count = 1
-            return render_template(
-                "test.html.j2",
-                form=form,
-                failures=failures,
-                error=error,
-                ok_count=ok_count,
-                fail_count=fail_count,
-            )
+            # results are kept in session once ready, to be saved with the function
+            server_session["source_code_test_run"] = {
+                "job_id": job_id,
+                "digest": digest,
+                "result": None,
+            }
+            return render_template("test.html.j2", form=form, job_id=job_id)
         elif form.next.data:  # clicked next
             if form.validate():  # data ok
                 documented = form.documented.data
@@ -497,12 +563,22 @@ def classify():
                 message = "Invalid parameters"
                 app.logger.error(message)
                 abort(400, message)
+        # keywords may have been generated with or in advance of the same documentation
+        documented = server_session["source_code_documented"]
+        form.keywords.data = (
+            _get_one_shot(documented).get("keywords")
+            or _get_prefetched(documented).get("keywords")
+            or _suggest_keywords(documented)
+        )
         return render_template("classify.html.j2", form=form)
 
     if request.method == "POST":
         if form.generate.data:  # clicked generate keywords
             try:
-                keywords = gpt.classify_code(server_session["source_code_documented"])
+                # LLM refines the keywords of similar functions
+                documented = server_session["source_code_documented"]
+                suggestions = keyword_classifier.suggest(documented)
+                keywords = gpt.classify_code(documented, suggestions)
                 keywords_str = ", ".join(keywords)
                 error = False
             except Exception:
@@ -520,11 +596,33 @@ def classify():
                 code = server_session["source_code_documented"]
                 tests = server_session["source_code_unittests"]
                 user_id = g.user.id
+
+                # results the author saw, if they were for the code being saved
+                quality = {}
+                checks = server_session.get("source_code_checks")
+                if (
+                    checks
+                    and checks["result"]
+                    and checks["digest"] == general.digest(server_session["source_code"])
+                ):
+                    quality["checks"] = checks["result"]
+                test_run = server_session.get("source_code_test_run")
+                if (
+                    test_run
+                    and test_run["result"]
+                    and test_run["digest"] == general.digest(code, tests)
+                ):
+                    quality["tests"] = test_run["result"]
+                # or an earlier run of the same tests, by anyone
+                elif cached := testrunner.cached_summary(code, tests):
+                    quality["tests"] = cached
+
                 try:
-                    gpt.check_code(code, mode="func")
-                    gpt.check_code(tests, mode="unit")
+                    moderated = server_session.get("source_code_moderated")
+                    if moderated != general.digest(code, tests):
+                        gpt.check_codes((code, "func"), (tests, "unit"))
                     function_id = function.save_function(
-                        code, tests, keywords_str, usecase, name, user_id
+                        code, tests, keywords_str, usecase, name, user_id, quality
                     )
                 except ValueError:
                     error = "Your source code was rejected"
@@ -534,13 +632,21 @@ def classify():
                     app.logger.exception(error)
                     return render_template("classify.html.j2", form=form, error=error)
 
+                # learn from the new function soon
+                keyword_classifier.schedule_refresh()
+
                 # clear saved function data from session
                 for arg in [
                     "source_code",
                     "source_code_documented",
                     "source_code_unittests",
+                    "source_code_checks",
+                    "source_code_test_run",
+                    "source_code_one_shot",
+                    "source_code_moderated",
                 ]:
-                    del server_session[arg]
+                    if arg in server_session:
+                        del server_session[arg]
 
                 return redirect(url_for("view_function", function_id=function_id))
             else:  # data not ok
@@ -694,6 +800,70 @@ def user(user_id_str: str):
     )
 
 
+# API-endpoint, not accesible by UI
+@app.route("/api/llm_metrics", methods=["GET"])
+@needs_admin
+def llm_metrics():
+    hours = request.args.get("hours", default=24, type=int)
+    since = general.get_time_hours_ago(hours)
+    try:
+        summary = llm_events.summarize(since)
+        histogram = llm_events.latency_histogram(since)
+        errors = llm_events.error_classes(since)
+    except Exception:
+        message = "Failed to read LLM metrics"
+        app.logger.exception(message)
+        abort(500, message)
+
+    # labels of the buckets, in milliseconds, bucket index 0 is below the first bound
+    bounds = llm_events.LATENCY_BUCKETS
+    buckets = [f"<{bounds[0]}"]
+    buckets += [f"{low}-{high}" for low, high in zip(bounds, bounds[1:])]
+    buckets += [f">={bounds[-1]}"]
+
+    requests = {}
+    for row in summary:
+        requests[(row.mode, row.model)] = {
+            "mode": row.mode,
+            "model": row.model,
+            "requests": row.requests,
+            "cached": row.cached,
+            "rejected": row.rejected,
+            "invalid": row.invalid,
+            "errors": row.errors,
+            "cancelled": row.cancelled,
+            "truncated": row.truncated,
+            "latency_ms": {
+                "p50": row.p50_ms,
+                "p95": row.p95_ms,
+                "histogram": {bucket: 0 for bucket in buckets},
+            },
+            "tokens": {
+                "prompt": row.prompt_tokens,
+                "completion": row.completion_tokens,
+                "max_completion": row.max_completion_tokens,
+            },
+            "error_classes": {},
+        }
+    # events logged after the summary was read have no entry, they are left out
+    for row in histogram:
+        if (row.mode, row.model) in requests:
+            requests[(row.mode, row.model)]["latency_ms"]["histogram"][
+                buckets[row.bucket]
+            ] = row.count
+    for row in errors:
+        if (row.mode, row.model) in requests:
+            entry = requests[(row.mode, row.model)]
+            entry["error_classes"][row.error_class] = row.count
+
+    return {
+        "since": since,
+        "requests": list(requests.values()),
+        # state of the web server worker that answered
+        "worker": {"cache": gpt.cache_stats(), "guard": llm_guard.stats()},
+    }
+
+
 # API-endpoint, not accesible by UI
 @app.route("/api/save_rating", methods=["POST"])
 @needs_user
@@ -726,6 +896,147 @@ def save_rating():
         return "", 500
 
 
+# API-endpoint, not accesible by UI
+@app.route("/api/checks/<string:job_id>", methods=["GET"])
+@needs_user
+def job_checks(job_id):
+    job = jobs.get(job_id, g.user.id)
+    if job is None:
+        return "", 404
+
+    # render results with the same macros as the rest of the page
+    macros = {
+        "lint": get_template_attribute("check_results.html.j2", "lint_results"),
+        "type": get_template_attribute("check_results.html.j2", "type_results"),
+        "security": get_template_attribute(
+            "check_results.html.j2", "security_results"
+        ),
+    }
+    messages = {
+        "timed out": get_template_attribute(
+            "check_results.html.j2", "timed_out_message"
+        ),
+        "failed": get_template_attribute("check_results.html.j2", "failed_message"),
+    }
+
+    # keep results of the latest run for saving
+    checks = server_session.get("source_code_checks")
+    if job["status"] == "done" and checks and checks["job_id"] == job_id:
+        results, timed_out, failed = job["result"]
+        checks["result"] = {
+            "results": results,
+            "timed_out": timed_out,
+            "failed": failed,
+        }
+        server_session["source_code_checks"] = checks
+
+    # results of the tools that have finished so far, or why there are none
+    finished = {}
+    for tool, result in job["progress"].items():
+        if isinstance(result, str):
+            finished[tool] = {
+                "timed_out": result == "timed out",
+                "failed": result == "failed",
+                "count": None,
+                "html": messages[result](),
+            }
+        else:
+            finished[tool] = {
+                "timed_out": False,
+                "failed": False,
+                "count": len(result),
+                "html": macros[tool](result),
+            }
+    return {
+        "done": jobs.is_finished(job),
+        "failed": job["status"] == "failed",
+        "checks": finished,
+    }
+
+
+# API-endpoint, not accesible by UI
+@app.route("/api/tests/<string:job_id>", methods=["GET"])
+@needs_user
+def job_tests(job_id):
+    job = jobs.get(job_id, g.user.id)
+    if job is None:
+        return "", 404
+    if not jobs.is_finished(job):
+        return {"done": False, "html": None}
+    if job["status"] == "failed":
+        return {"done": True, "html": None}
+
+    # keep results of the latest run for saving
+    test_run = server_session.get("source_code_test_run")
+    if test_run and test_run["job_id"] == job_id:
+        test_run["result"] = job["result"]
+        server_session["source_code_test_run"] = test_run
+
+    test_results = get_template_attribute("test_results.html.j2", "test_results")
+    return {"done": True, "html": test_results(**job["result"])}
+
+
+def _generate_code(source_code: str, mode: str, report) -> dict[str, str | None]:
+    """Background job for the generate buttons of /doc and /test.
+    Publishes the response so far as progress "text", returns the extracted code or the error to show.
+    """
+
+    try:
+        pieces = []
+        published = 0.0
+        for name, data in gpt.enhance_code_stream(source_code, mode):
+            if name == "token":
+                pieces.append(data)
+                # progress is written to the shared cache, so not for every token
+                if time.monotonic() - published >= 0.2:
+                    report("text", "".join(pieces))
+                    published = time.monotonic()
+            elif name == "done":
+                return {"code": data, "error": None}
+    except ValueError:
+        message = "Your source code was rejected."
+        app.logger.warning(message)
+        return {"code": None, "error": message}
+    except SyntaxError as e:
+        return {"code": None, "error": "SyntaxError: " + str(e)}
+    except Exception:
+        message = "Failed to generate code."
+        app.logger.exception(message)
+        return {"code": None, "error": message}
+
+
+# API-endpoint, not accesible by UI
+@app.route("/api/stream/<string:mode>", methods=["POST"])
+@needs_user
+def stream_enhancement(mode):
+    if mode not in ("doc", "test"):
+        abort(404)
+    source_code = request.form.get("source_code", "")
+
+    # the LLM may take long, so it's not waited for by a web server worker
+    job_id = jobs.submit(g.user.id, _generate_code, source_code, mode)
+    return {"url": url_for("job_generated", job_id=job_id)}
+
+
+# API-endpoint, not accesible by UI
+@app.route("/api/generated/<string:job_id>", methods=["GET"])
+@needs_user
+def job_generated(job_id):
+    job = jobs.get(job_id, g.user.id)
+    if job is None:
+        return "", 404
+    if job["status"] == "failed":
+        error = "Failed to generate code."
+        return {"done": True, "text": None, "code": None, "error": error}
+    result = job["result"] or {"code": None, "error": None}
+    return {
+        "done": jobs.is_finished(job),
+        "text": job["progress"].get("text", ""),
+        "code": result["code"],
+        "error": result["error"],
+    }
+
+
 @app.route("/search", methods=["GET"])
 @needs_user
 def search():
@@ -0,0 +1,130 @@
+"""Re-run the static checks of /add against every function in the library.
+
+Results are written to the reanalysis_results table under a run id, which by default
+identifies the installed tool versions. An interrupted run continues where it left off,
+when started again with the same tools.
+"""
+
+import argparse
+import collections
+import hashlib
+import logging
+import multiprocessing
+import time
+from qcl.integrations import analysis, linter, security, typecheck
+from qcl.models import reanalysis
+from qcl.utils import ast_checks
+
+
+def default_run_id() -> str:
+    "Hash of the tool fingerprints, so that upgrading any tool starts a new run."
+
+    digest = hashlib.sha256()
+    for tool in sorted(analysis.FINGERPRINTS):
+        digest.update(analysis.FINGERPRINTS[tool]().encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def stream_functions(run_id: str, batch_size: int):
+    "Yield batches of (function_id, code) that are not done yet, fetching one batch at a time."
+
+    after_id = 0
+    while rows := reanalysis.list_pending_functions(run_id, after_id, batch_size):
+        yield [(row.function_id, row.code) for row in rows]
+        after_id = rows[-1].function_id
+
+
+def _run_check(check: str, target: str, func, *args):
+    "Run one check, a failure is logged and gives None, so that the rest of the run goes on."
+
+    try:
+        return func(*args)
+    except Exception:
+        logging.exception(f"{check} check failed for {target}")
+        return None
+
+
+def _quick_check(code: str) -> list[dict]:
+    try:
+        return ast_checks.check_source(code)
+    except SyntaxError:
+        return []
+
+
+def analyze_batch(
+    batch: list[tuple[int, str]]
+) -> list[tuple[int, dict[str, list | None]]]:
+    """Run all checks for a batch of functions, pyright checks the whole batch in one go.
+    Checks that failed have None as result.
+    """
+
+    sources = [code for _, code in batch]
+    ids = ", ".join(str(function_id) for function_id, _ in batch)
+    type_results = _run_check(
+        "type", f"functions {ids}", typecheck.run_pyright_batch, sources
+    )
+    if type_results is None:
+        type_results = [None] * len(batch)
+
+    out = []
+    for (function_id, code), type_result in zip(batch, type_results):
+        target = f"function {function_id}"
+        results = {
+            "quick": _run_check("quick", target, _quick_check, code),
+            "lint": _run_check("lint", target, linter.run_pylint_local, code),
+            "security": _run_check("security", target, security.run_bandit, code),
+            "type": type_result,
+        }
+        out.append((function_id, results))
+    return out
+
+
+def reanalyze(run_id: str, processes: int, batch_size: int) -> None:
+    total = reanalysis.count_pending_functions(run_id)
+    logging.info(f"Run {run_id}: {total} functions to analyze")
+
+    done = 0
+    start = time.monotonic()
+
+    def save(results: list[tuple[int, dict[str, list]]]) -> None:
+        nonlocal done
+        for function_id, function_results in results:
+            reanalysis.save_results(run_id, function_id, function_results)
+        done += len(results)
+        rate = done / (time.monotonic() - start)
+        logging.info(f"{done}/{total} functions, {rate:.1f} functions/sec")
+
+    # fork, so that workers inherit already imported tools
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes=processes) as pool:
+        # keep a few batches queued per worker, instead of reading the whole table at once
+        pending = collections.deque()
+        for batch in stream_functions(run_id, batch_size):
+            pending.append(pool.apply_async(analyze_batch, (batch,)))
+            if len(pending) >= processes * 2:
+                save(pending.popleft().get())
+        while pending:
+            save(pending.popleft().get())
+
+    elapsed = time.monotonic() - start
+    rate = done / elapsed if elapsed else 0
+    logging.info(f"Analyzed {done} functions in {elapsed:.1f} s, {rate:.1f} functions/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--run-id", help="defaults to a hash of the tool versions")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="functions per task, and per pyright invocation",
+    )
+    args = parser.parse_args()
+
+    # the app logs every query on debug level
+    logging.getLogger().setLevel(logging.INFO)
+
+    reanalyze(args.run_id or default_run_id(), args.processes, args.batch_size)
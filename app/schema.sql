@@ -53,4 +53,77 @@ CREATE TABLE IF NOT EXISTS ratings (
     function_id INT NOT NULL REFERENCES functions(function_id) ON DELETE CASCADE,
     value INT NOT NULL CHECK (value BETWEEN 1 AND 5),
     PRIMARY KEY (user_id, function_id)
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS result_cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data BYTEA NOT NULL,
+    created INT DEFAULT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP),
+    accessed INT DEFAULT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP),
+    PRIMARY KEY (namespace, key)
+);
+
+CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache (namespace, accessed);
+
+CREATE TABLE IF NOT EXISTS reanalysis_results (
+    run_id TEXT NOT NULL,
+    function_id INT NOT NULL REFERENCES functions(function_id) ON DELETE CASCADE,
+    quick_count INT NOT NULL,
+    lint_count INT NOT NULL,
+    security_count INT NOT NULL,
+    type_count INT NOT NULL,
+    data BYTEA NOT NULL,
+    analyzed INT DEFAULT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP),
+    PRIMARY KEY (run_id, function_id)
+);
+
+-- a check that failed for a function has no count, the names of the failed checks are kept in error
+ALTER TABLE reanalysis_results
+    ADD COLUMN IF NOT EXISTS error TEXT,
+    ALTER COLUMN quick_count DROP NOT NULL,
+    ALTER COLUMN lint_count DROP NOT NULL,
+    ALTER COLUMN security_count DROP NOT NULL,
+    ALTER COLUMN type_count DROP NOT NULL;
+
+-- results of the checks and the test run the author saw when saving the function
+ALTER TABLE functions
+    ADD COLUMN IF NOT EXISTS quality BYTEA,
+    ADD COLUMN IF NOT EXISTS lint_count INT,
+    ADD COLUMN IF NOT EXISTS security_count INT,
+    ADD COLUMN IF NOT EXISTS type_count INT,
+    ADD COLUMN IF NOT EXISTS tests_passed INT,
+    ADD COLUMN IF NOT EXISTS tests_failed INT;
+
+-- when the function was saved or last edited, the keyword classifier picks up changes by it
+ALTER TABLE functions
+    ADD COLUMN IF NOT EXISTS modified INT NOT NULL DEFAULT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP);
+
+CREATE INDEX IF NOT EXISTS functions_modified ON functions (modified, function_id);
+
+CREATE OR REPLACE FUNCTION set_modified() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.modified = EXTRACT(EPOCH FROM CURRENT_TIMESTAMP);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS functions_modified ON functions;
+CREATE TRIGGER functions_modified BEFORE UPDATE ON functions
+    FOR EACH ROW EXECUTE FUNCTION set_modified();
+
+-- one row per LLM request, including cache hits and failures
+CREATE TABLE IF NOT EXISTS llm_events (
+    event_id SERIAL PRIMARY KEY,
+    event_time INT DEFAULT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP),
+    mode TEXT NOT NULL,
+    model TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    error_class TEXT,
+    latency_ms INT NOT NULL,
+    prompt_tokens INT,
+    completion_tokens INT,
+    truncated BOOLEAN
+);
+
+CREATE INDEX IF NOT EXISTS llm_events_time ON llm_events (event_time);
@@ -0,0 +1,32 @@
+import unittest
+from qcl.integrations import testrunner
+
+
+class TestSummarize(unittest.TestCase):
+    def test_passes_and_errors(self):
+        results = {
+            "total": 3,
+            "failures": ["AssertionError: 1 != 2"],
+            "errors": ["NameError: name 'x' is not defined"],
+            "skipped": [],
+            "successful": False,
+        }
+        summary = testrunner.summarize(results)
+        self.assertEqual(summary["ok_count"], 1)
+        self.assertEqual(summary["fail_count"], 2)
+        self.assertEqual(len(summary["failures"]), 2)
+        # results may be cached, they must not change
+        self.assertEqual(len(results["failures"]), 1)
+
+    def test_all_pass(self):
+        results = {
+            "total": 2,
+            "failures": [],
+            "errors": [],
+            "skipped": [],
+            "successful": True,
+        }
+        summary = testrunner.summarize(results)
+        self.assertEqual(summary["ok_count"], 2)
+        self.assertEqual(summary["fail_count"], 0)
+        self.assertEqual(summary["failures"], [])
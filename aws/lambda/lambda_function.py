@@ -1,14 +1,42 @@
-from multiprocessing import Process, Manager, set_start_method, get_start_method
-from multiprocessing.managers import DictProxy
+from functools import partial
+import json
+import multiprocessing
+from multiprocessing.connection import Connection
 import os
+import resource
 import sys
+import time
 from types import ModuleType
 import unittest
 
 TEST_CLASS_NAME = "Test"
 
+# directories the tests may read from, the runtime and its packages
+ALLOWED_READ_PATHS = ("/opt/python/", "/var/lang/")
 
-def allowlist(event, args):
+# resource limits of a sandbox: address space and size of written files in bytes,
+# CPU time in seconds, and numbers of processes and open files
+SANDBOX_LIMITS = {
+    "RLIMIT_AS": 512 * 2**20,
+    "RLIMIT_CPU": 30,
+    "RLIMIT_FSIZE": 0,
+    "RLIMIT_NOFILE": 64,
+    "RLIMIT_NPROC": 0,
+}
+
+# largest results read from a sandbox, in bytes, Lambda can't return more anyway
+MAX_RESULT_SIZE = 6 * 2**20
+
+# sandboxes are forked from a server process that has imported everything once,
+# the server stays warm across invocations of the same container
+mp_context = multiprocessing.get_context("forkserver")
+mp_context.set_forkserver_preload(["unittest", __name__])
+
+# sandbox started in advance, waiting for the next invocation: (process, job connection, result connection)
+warm_sandbox = None
+
+
+def allowlist(event, args, read_paths=ALLOWED_READ_PATHS):
     "Raises PermissionError if non-allowlisted operation is attempted."
 
     eventtype = event.split(".", maxsplit=1)[0]
@@ -18,11 +46,9 @@ def allowlist(event, args):
         "exec",  # needed for import
         "compile",  # needed for import
         "marshal.loads",  # needed for import
-        "sys._getframe",  # needed for collections lib
+        "sys._getframe",  # needed for namedtuple and Enum
         "sys.excepthook",  # needed for raising exceptions
         "builtins.id",  # needed for multiprocessing comms
-        "socket.__new__",  # needed for multiprocessing comms
-        "socket.connect",  # needed for multiprocessing comms
         "os.putenv",  # process has its own environment
         "os.unsetenv",  # process has its own environment
     ]
@@ -32,9 +58,7 @@ def allowlist(event, args):
             filepath, mode, _ = args
             if mode != "r":
                 raise PermissionError("Filesystem is read-only")
-            if not (
-                filepath.startswith("/opt/python/") or filepath.startswith("/var/lang/")
-            ):
+            if not filepath.startswith(tuple(read_paths)):
                 raise PermissionError(
                     f"Read access to file '{filepath}' is not allowed"
                 )
@@ -42,14 +66,78 @@ def allowlist(event, args):
             raise PermissionError(f"{event} is not allowed")
 
 
+def max_rss() -> int:
+    "Peak resident memory of the process so far, in bytes."
+
+    # reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ProfilingResult(unittest.TestResult):
+    """TestResult that also measures the time used by each test, and the peak memory of the process after it.
+    The peak is cumulative, a test only changes it by raising the high-water mark of the tests before it.
+    Allocations are not traced per test, tracemalloc slowed down the tests 6-15 times."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.profile = []
+
+    def startTest(self, test) -> None:
+        super().startTest(test)
+        # outcome of the test is told by which list grows
+        self.counts = (len(self.failures), len(self.errors), len(self.skipped))
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+
+    def stopTest(self, test) -> None:
+        wall_time = time.perf_counter() - self.wall_start
+        cpu_time = time.process_time() - self.cpu_start
+        failures, errors, skipped = self.counts
+        if len(self.errors) > errors:
+            outcome = "error"
+        elif len(self.failures) > failures:
+            outcome = "failure"
+        elif len(self.skipped) > skipped:
+            outcome = "skipped"
+        else:
+            outcome = "ok"
+        self.profile.append(
+            {
+                "name": test.id().rsplit(".", maxsplit=1)[-1],
+                "outcome": outcome,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "max_rss": max_rss(),
+            }
+        )
+        super().stopTest(test)
+
+
+def set_limits(limits: dict) -> None:
+    "Limit resources of the process, by names of the resource module constants."
+
+    for name, value in limits.items():
+        limit = getattr(resource, name)
+        _, hard = resource.getrlimit(limit)
+        # limits can only be lowered, and the code can't raise them back
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, value))
+
+
 def execute_tests(
-    test_code_str: str, func_code_str: str, shared_dict: DictProxy
-) -> None:
-    """This function is run in a separate, restricted process.
-    It communicates with the parent process through DictProxy."""
+    test_code_str: str,
+    func_code_str: str,
+    read_paths=ALLOWED_READ_PATHS,
+    limits=SANDBOX_LIMITS,
+) -> dict:
+    """This function is run in a separate, single-use process, and restricts it before running the code.
+    Returns the results as a dict."""
+
+    set_limits(limits)
 
     # only allow selected operations from now on
-    sys.addaudithook(allowlist)
+    sys.addaudithook(partial(allowlist, read_paths=tuple(read_paths)))
 
     # start with clean environment
     os.environ.clear()
@@ -64,54 +152,111 @@ def execute_tests(
         test_class = getattr(unittest_module, TEST_CLASS_NAME)
 
         # create TestResult object to store results
-        result = unittest.TestResult()
+        result = ProfilingResult()
 
         # run the unittest and store results in TestResult object
         suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
         suite.run(result)
 
         # generate the result dictionary
-        results_dict = {
+        return {
             "total": result.testsRun,
             "failures": [str(f[1]) for f in result.failures],
             "errors": [str(e[1]) for e in result.errors],
             "skipped": [str(s[1]) for s in result.skipped],
             "successful": result.wasSuccessful(),
+            # wall and CPU time in seconds, peak memory in bytes
+            "tests": result.profile,
+            "max_rss": max_rss(),
         }
 
-        # save output to a dict that can be read from parent process
-        shared_dict.update(results_dict)
-
     except:
         # executing the untrusted code failed, most likely syntax error
         import traceback
 
-        shared_dict.update({"error": traceback.format_exc()})
+        return {"error": traceback.format_exc()}
+
+
+def send_json(conn: Connection, data) -> None:
+    "Send data through the pipe as JSON."
+
+    conn.send_bytes(json.dumps(data).encode("utf-8"))
+
+
+def receive_results(result_conn: Connection) -> dict:
+    """Read the results of a sandbox. The tests can write anything to the pipe,
+    so it's only ever decoded as JSON, never unpickled outside the sandbox."""
+
+    try:
+        results = json.loads(result_conn.recv_bytes(MAX_RESULT_SIZE))
+    except EOFError:
+        return {"error": "Test process exited without results"}
+    except (OSError, ValueError):
+        return {"error": "Test process sent invalid results"}
+    if not isinstance(results, dict):
+        return {"error": "Test process sent invalid results"}
+    return results
+
+
+def run_sandbox(job_conn: Connection, result_conn: Connection) -> None:
+    """Entry point of a sandbox process. Waits unrestricted for a single job,
+    then runs it and sends the results back through the pipe.
+    The job is the arguments of execute_tests, both are sent as JSON."""
+
+    try:
+        job = json.loads(job_conn.recv_bytes())
+    except EOFError:
+        # container is shutting down, no job will come
+        return
+    job_conn.close()
+
+    send_json(result_conn, execute_tests(*job))
+
+
+def start_sandbox() -> tuple:
+    "Fork a new sandbox process, ready to receive a job."
+
+    job_reader, job_writer = mp_context.Pipe(duplex=False)
+    result_reader, result_writer = mp_context.Pipe(duplex=False)
+    process = mp_context.Process(
+        target=run_sandbox, args=(job_reader, result_writer), daemon=True
+    )
+    process.start()
+
+    # only the sandbox keeps its ends open, so that reading fails if it exits early
+    job_reader.close()
+    result_writer.close()
+    return process, job_writer, result_reader
 
 
 def lambda_handler(event, context) -> dict:
-    """Receives user input, spawns a separate process (with restricted permissions,
-    separate resources and environment) for running untrusted code"""
+    """Receives user input, and runs it in a separate, single-use process
+    (with restricted permissions, separate resources and environment) for running untrusted code"""
 
-    # if not yet set, configure start method to spawn a separate process for each invokation
-    # slow, but better isolation
-    if get_start_method(allow_none=True) != "spawn":
-        set_start_method("spawn")
+    global warm_sandbox
 
     # read user input
     source_func = event["func"]
     source_test = event["test"]
 
-    # prepare the shared dict
-    manager = Manager()
-    shared_dict = manager.dict()
-
-    # run execute_tests function in a separate process
-    p = Process(target=execute_tests, args=(source_test, source_func, shared_dict))
-    p.start()
+    # use the sandbox started during the previous invocation
+    sandbox = warm_sandbox or start_sandbox()
+    warm_sandbox = None
+    process, job_conn, result_conn = sandbox
+    try:
+        send_json(job_conn, (source_test, source_func))
+    except OSError:
+        # the waiting sandbox is gone, start over with a new one
+        process.join()
+        process, job_conn, result_conn = start_sandbox()
+        send_json(job_conn, (source_test, source_func))
+    job_conn.close()
 
-    # wait for the process to finish
-    p.join()
+    # wait for the results, and for the process to finish
+    results = receive_results(result_conn)
+    result_conn.close()
+    process.join()
 
-    # fetch the results from DictProxy, and cast to dictionary
-    return dict(shared_dict)
+    # prepare a sandbox for the next invocation
+    warm_sandbox = start_sandbox()
+    return results